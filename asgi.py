@@ -0,0 +1,328 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import server
+from upstream import AsyncUpstreamClient, UpstreamBusy, env_int
+
+# ASGI entry point: `uvicorn asgi:app --port 5000`.
+# /api/chat and /api/generate-image are served natively on the event loop so a
+# slow Hugging Face or Pollinations call only costs a coroutine, not a worker
+# thread. Every other route is handed to the Flask app unchanged.
+
+hf_async_client = AsyncUpstreamClient(
+    'huggingface', server.HF_API_URL, read_timeout=10, metrics=server.hf_client.metrics
+)
+pollinations_async_client = AsyncUpstreamClient(
+    'pollinations', server.POLLINATIONS_URL, read_timeout=30, metrics=server.pollinations_client.metrics
+)
+
+
+
+def terminated_input(wsgi_app):
+    # asgiref buffers the whole body into a file before calling the WSGI app
+    # but never sets wsgi.input_terminated, and without a Content-Length
+    # Werkzeug then reads a chunked body as empty. The buffered file does
+    # end, so say so.
+    def wrapped(environ, start_response):
+        environ['wsgi.input_terminated'] = True
+        return wsgi_app(environ, start_response)
+    return wrapped
+
+
+# Flask is run threaded everywhere else (gunicorn gthread, the dev server),
+# so it gets a pool here too. asgiref's default runs every request on one
+# shared "thread sensitive" thread, which serialises them, and under
+# concurrency intermittently fails with "CurrentThreadExecutor already quit
+# or is broken" (a 500 from uvicorn).
+flask_executor = ThreadPoolExecutor(env_int('ASGI_FLASK_THREADS', 8), thread_name_prefix='flask')
+
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__['run_wsgi_app'].__wrapped__, thread_sensitive=False, executor=flask_executor
+    )
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+flask_app = PooledWsgiToAsgi(terminated_input(server.app))
+
+
+class Headers:
+    # Case-insensitive read-only view of the ASGI header list.
+
+    def __init__(self, scope):
+        self._headers = {}
+        for name, value in scope.get('headers', []):
+            self._headers[name.decode('latin-1').lower()] = value.decode('latin-1')
+
+    def get(self, name, default=None):
+        return self._headers.get(name.lower(), default)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def capped_receive(receive, max_length):
+    # For bodies sent without a Content-Length: stops buffering one byte past
+    # the cap, which is enough for Flask to answer 413, rather than spooling
+    # the rest of an oversized upload.
+    received = 0
+
+    async def wrapped():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request' and max_length is not None:
+            body = message.get('body', b'')
+            if received + len(body) > max_length:
+                message = dict(message, body=body[:max_length + 1 - received], more_body=False)
+            received += len(body)
+        return message
+    return wrapped
+
+
+async def read_body(receive, max_length=None):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if max_length is not None and len(body) > max_length:
+            raise BodyTooLarge(f'Request body too large (limit {max_length} bytes)')
+        if not message.get('more_body', False):
+            return body
+
+
+async def send_json(send, payload, status=200, headers=None):
+    body = json.dumps(payload).encode('utf-8')
+    extra = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in (headers or {}).items()]
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+            (b'access-control-allow-origin', b'*')
+        ] + extra
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream_chat_events(message, image=None, bypass=False):
+    # Async twin of server.stream_chat_events.
+    if image:
+        for event in server.canned_chat_events(server.image_chat_response(message), 'vision-demo'):
+            yield event
+        return
+
+    stream = server.ChatStream(message, bypass)
+    if stream.cached is not None:
+        for event in server.canned_chat_events(stream.cached, 'cache'):
+            yield event
+        return
+
+    if stream.begin():
+        payload = dict(server.hf_chat_payload(message), stream=True)
+        try:
+            async for line in hf_async_client.stream_lines('POST', server.HF_CHAT_MODEL, json=payload):
+                text = server.hf_stream_token(line)
+                if text:
+                    yield stream.token(text)
+            stream.complete()
+        except Exception as e:
+            stream.fail(e)
+        stream.end()
+    for event in stream.finish():
+        yield event
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def send_event_stream(receive, send, events):
+    headers = [(b'content-type', b'text/event-stream'), (b'access-control-allow-origin', b'*')]
+    headers += [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in server.SSE_HEADERS.items()]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    async def pump():
+        async for event in events:
+            await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    pump_task = asyncio.ensure_future(pump())
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # A client that goes away cancels the pump, which unwinds the
+        # upstream request and closes its connection.
+        for task in (pump_task, disconnect_task):
+            task.cancel()
+        await asyncio.gather(pump_task, disconnect_task, return_exceptions=True)
+        await events.aclose()
+
+
+async def chat(data, headers):
+    message = data.get('message', '')
+    image = data.get('image', None)
+
+    if not message:
+        return {'success': False, 'error': 'Message is required'}, 400
+
+    if image:
+        response_text = server.image_chat_response(message)
+    else:
+        async def fetch_reply():
+            # Async twin of server.fetch_hf_chat_reply.
+            breaker = server.hf_breakers.get(server.HF_CHAT_MODEL)
+            if not breaker.allow():
+                return server.chat_fallback_response(message, 'circuit_open'), False
+            start = time.perf_counter()
+            try:
+                hf_response = await hf_async_client.post(server.HF_CHAT_MODEL, json=server.hf_chat_payload(message))
+                result = hf_response.json() if hf_response.status_code == 200 else None
+            except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamBusy, ValueError) as e:
+                return server.hf_chat_outcome(message, breaker, start, error=e)
+            return server.hf_chat_outcome(message, breaker, start, hf_response.status_code, result)
+
+        response_text = await server.chat_cache.get_or_fetch_async(
+            server.hf_chat_cache_key(message), fetch_reply, bypass=server.chat_cache_bypassed(headers)
+        )
+
+    return {'success': True, 'response': response_text}, 200
+
+
+async def generate_image(data, headers):
+    prompt = data.get('prompt', '')
+
+    if not prompt:
+        return {'success': False, 'error': 'Prompt is required'}, 400
+
+    image_path = server.image_path_for(prompt)
+    image_url = pollinations_async_client.url(image_path)
+
+    async def fetch_image():
+        response = await pollinations_async_client.get(image_path)
+        return response.content if response.status_code == 200 else None
+
+    image_id = server.prompt_key(prompt)
+    try:
+        content = await server.image_cache.get_or_fetch_async(image_id, fetch_image)
+    except UpstreamBusy:
+        return {'success': False, 'error': 'Image service is busy, please try again'}, 503
+
+    if content is not None:
+        inline = data.get('format') == 'base64'
+        return server.image_success_payload(image_id, content, image_url, inline), 200
+    return {'success': False, 'error': 'Failed to generate image'}, 500
+
+
+ASYNC_ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/generate-image'): generate_image
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Under `uvicorn --workers N` every worker runs this; leader
+            # election makes sure only one of them runs the scheduler.
+            server.create_app()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            server.stop_reminder_services()
+            await hf_async_client.aclose()
+            await pollinations_async_client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path')))
+    if handler is None:
+        # asgiref buffers the whole body before Flask sees the request, so
+        # oversized bodies are refused here; Flask applies the rate limits.
+        if scope['type'] == 'http':
+            content_length = Headers(scope).get('content-length')
+            route = server.route_for(scope['path'], scope['method'])
+            max_length = server.request_size_limits.limit_for(route)
+            if content_length and content_length.isdigit() and max_length is not None and int(content_length) > max_length:
+                await send_json(send, {'success': False, 'error': f'Request body too large (limit {max_length} bytes)'}, 413)
+                return
+            if content_length is None:
+                receive = capped_receive(receive, max_length)
+        await flask_app(scope, receive, send)
+        return
+
+    # Native routes bypass the Flask middleware, so they are timed here with
+    # the same histogram and labels.
+    start = time.perf_counter()
+    status = ['500']
+
+    async def recording_send(message):
+        if message['type'] == 'http.response.start':
+            status[0] = str(message['status'])
+        await send(message)
+
+    try:
+        await handle_async_route(handler, scope, receive, recording_send)
+    finally:
+        server.request_latency.observe(time.perf_counter() - start, scope['method'], scope['path'], status[0])
+
+
+async def handle_async_route(handler, scope, receive, send):
+    headers = Headers(scope)
+    route = scope['path']
+    content_length = headers.get('content-length')
+    client = scope['client'][0] if scope.get('client') else ''
+    rejection = server.request_limit_rejection(
+        client, route, scope['method'], int(content_length) if content_length and content_length.isdigit() else None
+    )
+    if rejection is not None:
+        await send_json(send, *rejection)
+        return
+    try:
+        body = await read_body(receive, server.request_size_limits.limit_for(route))
+    except BodyTooLarge as e:
+        await send_json(send, {'success': False, 'error': str(e)}, 413)
+        return
+    if body is None:
+        return
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        await send_json(send, {'success': False, 'error': 'Invalid JSON body'}, 400)
+        return
+    if handler is chat and isinstance(data, dict) and data.get('message') and server.chat_stream_requested(data, headers):
+        events = stream_chat_events(data['message'], data.get('image'), bypass=server.chat_cache_bypassed(headers))
+        await send_event_stream(receive, send, events)
+        return
+    try:
+        payload, status = await handler(data, headers)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error in {scope['path']}: {str(e)}")
+        payload, status = {'success': False, 'error': str(e)}, 500
+    await send_json(send, payload, status)
@@ -0,0 +1,59 @@
+# Compares importing N reminders through N calls to /api/create-reminder with
+# a single /api/reminders/bulk request, against a throwaway SQLite store.
+#
+#   python benchmarks/bench_bulk_reminders.py --count 2000
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PHRASES = [
+    "Remind me to call John tomorrow at 3 PM",
+    "Remind me to buy groceries on December 15 at 10 AM",
+    "Remind me to submit report next Monday at 9 AM",
+    "Doctor appointment on Jan 5 at 10:00 AM",
+    "Remind me to stretch in 20 minutes",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--single-count', type=int, default=300,
+                        help='single-endpoint calls to time (extrapolated to --count)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['REMINDER_DB'] = os.path.join(tmp, 'bench.db')
+    os.environ.setdefault('IMAGE_CACHE_DIR', '')
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    import server
+
+    client = server.app.test_client()
+    messages = [f"{PHRASES[i % len(PHRASES)]} #{i}" for i in range(args.count)]
+
+    start = time.perf_counter()
+    for message in messages[:args.single_count]:
+        client.post('/api/create-reminder', json={'message': message, 'email': 'bench@example.com'})
+    single = (time.perf_counter() - start) / args.single_count
+
+    body = '\n'.join(json.dumps({'message': m}) for m in messages)
+    start = time.perf_counter()
+    response = client.post('/api/reminders/bulk?email=bench@example.com', data=body,
+                           content_type='application/x-ndjson')
+    lines = response.data.decode('utf-8').splitlines()
+    bulk = time.perf_counter() - start
+    summary = json.loads(lines[-1])['summary']
+
+    print(f"single endpoint: {single * 1000:.2f} ms/reminder -> ~{single * args.count:.2f}s for {args.count}")
+    print(f"bulk endpoint:   {bulk:.2f}s for {args.count} ({bulk / args.count * 1000:.3f} ms/reminder), {summary}")
+    print(f"speed-up: {single * args.count / bulk:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
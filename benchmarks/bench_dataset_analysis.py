@@ -0,0 +1,88 @@
+# Runs the fine-tuning dataset analysis over a synthetic JSONL dataset with a
+# known number of exact and near duplicates, for each worker count.
+#
+#   python benchmarks/bench_dataset_analysis.py --count 1000000 --workers 1,2,4,8
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dataset_analysis import analyse_examples  # noqa: E402
+from finetune_data import iter_jsonl_examples  # noqa: E402
+
+SYSTEM = "You are a helpful customer support assistant for TechCorp."
+TOPICS = ['password', 'refund', 'shipping', 'invoice', 'account', 'warranty', 'discount', 'delivery']
+VERBS = ['reset', 'change', 'track', 'cancel', 'update', 'check', 'request', 'find']
+FILLER = ('please follow the steps in your account settings and contact support if the problem '
+          'continues after trying them we are happy to help with anything else').split()
+
+
+def make_example(rng, i):
+    topic = rng.choice(TOPICS)
+    words = [f"w{i}x{k}" for k in range(6)] + rng.sample(FILLER, 12)
+    return {
+        'messages': [
+            {'role': 'system', 'content': SYSTEM},
+            {'role': 'user', 'content': f"How do I {rng.choice(VERBS)} my {topic}? ref {i}"},
+            {'role': 'assistant', 'content': ' '.join(words)}
+        ]
+    }
+
+
+def make_dataset(count, duplicate_rate, seed=7):
+    # Every 1/duplicate_rate-th example repeats an earlier one, alternating
+    # between verbatim copies and copies with one word changed.
+    rng = random.Random(seed)
+    lines = []
+    examples = []
+    exact = near = 0
+    step = int(1 / duplicate_rate) if duplicate_rate else 0
+    for i in range(count):
+        if step and i and i % step == 0:
+            source = examples[rng.randrange(len(examples))]
+            if (i // step) % 2:
+                example = source
+                exact += 1
+            else:
+                example = json.loads(json.dumps(source))
+                example['messages'][2]['content'] += ' thanks'
+                near += 1
+        else:
+            example = make_example(rng, i)
+            examples.append(example)
+        lines.append(json.dumps(example))
+    return ('\n'.join(lines) + '\n').encode('utf-8'), exact, near
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"generating {args.count} examples...")
+    data, exact, near = make_dataset(args.count, args.duplicate_rate)
+    print(f"{len(data) / 1e6:.1f} MB, injected {exact} exact and {near} near duplicates "
+          f"(cpu_count={os.cpu_count()})")
+
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        start = time.perf_counter()
+        analysis = analyse_examples(iter_jsonl_examples(io.BytesIO(data)), workers=workers)
+        result = analysis.result()
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} {elapsed:7.2f}s  {args.count / elapsed:9.0f} examples/s  "
+              f"speedup {baseline / elapsed:4.1f}x  exact={result['duplicates']['exact']} "
+              f"near={result['duplicates']['near']} tokens={result['tokens']['total']}")
+
+
+if __name__ == '__main__':
+    main()
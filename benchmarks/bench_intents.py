@@ -0,0 +1,94 @@
+# Per-message latency of the compiled intent matcher against the original
+# chain of `any(word in message_lower ...)` scans, for a synthetic table of a
+# few hundred intents and for the shipped intents.json.
+#
+#   python benchmarks/bench_intents.py --intents 300
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import IntentMatcher, load_intent_matchers
+
+
+def legacy_respond(intents, default, message):
+    message_lower = message.lower()
+    for intent in intents:
+        if any(word in message_lower for word in intent['keywords']):
+            return intent['response'].replace('{message}', message)
+    return default.replace('{message}', message)
+
+
+def random_word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def synthetic_intents(rng, count, keywords_per_intent):
+    intents = []
+    for i in range(count):
+        keywords = [random_word(rng, rng.randint(5, 10)) for _ in range(keywords_per_intent)]
+        if i % 5 == 0:
+            keywords.append(f"{random_word(rng, 4)} {random_word(rng, 6)}")
+        intents.append({'name': f"intent_{i}", 'keywords': keywords, 'response': f"Response {i} to {{message}}"})
+    return intents
+
+
+def synthetic_messages(rng, intents, count, words):
+    messages = []
+    for i in range(count):
+        parts = [random_word(rng, rng.randint(2, 9)) for _ in range(words)]
+        if i % 2 == 0:
+            # Half the messages hit an intent somewhere in the table.
+            parts.insert(rng.randrange(len(parts)), rng.choice(rng.choice(intents)['keywords']))
+        messages.append(' '.join(parts).capitalize())
+    return messages
+
+
+def time_per_message(fn, messages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (rounds * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--intents', type=int, default=300)
+    parser.add_argument('--keywords', type=int, default=3)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--words', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    intents = synthetic_intents(rng, args.intents, args.keywords)
+    default = "Default reply to {message}"
+    messages = synthetic_messages(rng, intents, args.messages, args.words)
+
+    start = time.perf_counter()
+    matcher = IntentMatcher(intents, default)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    mismatches = sum(matcher.respond(m) != legacy_respond(intents, default, m) for m in messages)
+    legacy = time_per_message(lambda m: legacy_respond(intents, default, m), messages, args.rounds)
+    compiled = time_per_message(matcher.respond, messages, args.rounds)
+    print(f"{args.intents} intents x {args.keywords}+ keywords, {args.words}-word messages "
+          f"(compiled in {compile_ms:.1f} ms, {mismatches} answers differ from substring matching)")
+    print(f"legacy any() chains: {legacy * 1e6:8.1f} us/message")
+    print(f"compiled matcher:    {compiled * 1e6:8.1f} us/message  ({legacy / compiled:.1f}x)")
+
+    shipped = load_intent_matchers()
+    sample = ['Hello there', 'How do I reset my password?', 'What are your business hours?',
+              'Tell me something interesting about space', 'My device is broken and I need a refund']
+    for name, matcher in shipped.items():
+        per_message = time_per_message(matcher.respond, sample, 2000)
+        print(f"intents.json [{name}]: {per_message * 1e6:.1f} us/message")
+
+
+if __name__ == '__main__':
+    main()
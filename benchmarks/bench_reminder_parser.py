@@ -0,0 +1,102 @@
+# Correctness suite and throughput benchmark for reminder_parser.
+#
+# Every phrase in CORPUS is parsed against a fixed "now" and checked against
+# the expected task and due time (the README's example phrases come first).
+# Then parses/sec is measured with a cold cache and with a warm cache.
+#
+#   python benchmarks/bench_reminder_parser.py
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reminder_parser import parse_reminder, parse_reminder_spec
+
+NOW = datetime(2024, 12, 1, 12, 30)  # a Sunday
+
+CORPUS = [
+    ("Remind me to call John tomorrow at 3 PM", "call John", "2024-12-02 15:00"),
+    ("Meeting reminder on December 20 at 2:30 PM", "Meeting", "2024-12-20 14:30"),
+    ("Remind me to submit report next Monday at 9 AM", "submit report", "2024-12-02 09:00"),
+    ("Doctor appointment on Jan 5 at 10:00 AM", "Doctor appointment", "2025-01-05 10:00"),
+    ("Remind me to buy groceries on December 15 at 10 AM", "buy groceries", "2024-12-15 10:00"),
+    ("Remind me to pay rent on 2024-12-20", "pay rent", "2024-12-20 09:00"),
+    ("Remind me to email Bob on 12/3", "email Bob", "2024-12-03 09:00"),
+    ("Remind me to renew passport on 3/14/2025 at 11:15", "renew passport", "2025-03-14 11:15"),
+    ("Remind me to file taxes on 15th of April 2025 at 17:45", "file taxes", "2025-04-15 17:45"),
+    ("remind me to stretch in 20 minutes", "stretch", "2024-12-01 12:50"),
+    ("Remind me to check the oven in an hour", "check the oven", "2024-12-01 13:30"),
+    ("Remind me to water the plants in 3 days", "water the plants", "2024-12-04 09:00"),
+    ("Remind me to review the budget in two weeks at 4pm", "review the budget", "2024-12-15 16:00"),
+    ("Remind me to call mom on Friday about the party", "call mom about the party", "2024-12-06 09:00"),
+    ("Remind me to go to the gym this sat at 7am", "go to the gym", "2024-12-07 07:00"),
+    ("Remind me to call John Sunday at 9am", "call John", "2024-12-08 09:00"),
+    ("Remind me to call John Sunday at 5pm", "call John", "2024-12-01 17:00"),
+    ("take out the trash tonight", "take out the trash", "2024-12-01 20:00"),
+    ("Remind me to go jogging tomorrow morning", "go jogging", "2024-12-02 09:00"),
+    ("lunch with Sam at noon", "lunch with Sam", "2024-12-02 12:00"),
+    ("Remind me to lock up at midnight", "lock up", "2024-12-02 00:00"),
+    ("Remind me to start the dishwasher at 3", "start the dishwasher", "2024-12-01 15:00"),
+    ("remind me to plan the trip the day after tomorrow", "plan the trip", "2024-12-03 09:00"),
+    ("Remind me to send the invoice next week", "send the invoice", "2024-12-08 09:00"),
+    ("Set a reminder to book flights on Dec 10th, 2024 at 6 p.m.", "book flights", "2024-12-10 18:00"),
+    ("Remind me to stand up", "stand up", "2024-12-01 13:30"),
+    ("buy milk on January 1", "buy milk", "2025-01-01 09:00"),
+]
+
+INVALID = [
+    "Remind me to check at 25:00",
+    "Remind me to celebrate on Feb 30",
+    "tomorrow at 3 PM",
+    "Remind me to renew passport on 3/14/99999",
+    "Remind me to wait in 99999999999 days",
+    "buy milk on January 1 2020",
+    "Remind me to call John today at 8am",
+    "garbage",
+]
+
+
+def check_corpus():
+    failures = 0
+    for phrase, task, expected in CORPUS:
+        result = parse_reminder(phrase, NOW)
+        if not result.get('parsed') or result['task'] != task or result['datetime'] != expected:
+            failures += 1
+            print(f"FAIL {phrase!r}: got {result}, expected task={task!r} datetime={expected!r}")
+    for phrase in INVALID:
+        result = parse_reminder(phrase, NOW)
+        if result.get('parsed'):
+            failures += 1
+            print(f"FAIL {phrase!r}: expected a parse error, got {result}")
+    total = len(CORPUS) + len(INVALID)
+    print(f"correctness: {total - failures}/{total} phrases as expected")
+    return failures
+
+
+def parses_per_second(phrases, rounds, cold):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if cold:
+            parse_reminder_spec.cache_clear()
+        for phrase in phrases:
+            parse_reminder(phrase, NOW)
+    return rounds * len(phrases) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    failures = check_corpus()
+    phrases = [phrase for phrase, _, _ in CORPUS]
+    print(f"cold cache: {parses_per_second(phrases, args.rounds, cold=True):,.0f} parses/sec")
+    print(f"warm cache: {parses_per_second(phrases, args.rounds, cold=False):,.0f} parses/sec")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Measures fire latency and CPU cost of ReminderScheduler with a large backlog
+# of pending reminders, next to the cost of one tick of the old 30s polling scan.
+#
+#   python benchmarks/bench_scheduler.py --pending 100000 --fires 200
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import REMINDER_TIME_FORMAT, ReminderScheduler
+
+
+def legacy_scan(reminders, current_time):
+    for reminder in reminders:
+        if not reminder['sent']:
+            reminder_time = datetime.strptime(reminder['datetime'], REMINDER_TIME_FORMAT)
+            if current_time >= reminder_time:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pending', type=int, default=100000)
+    parser.add_argument('--fires', type=int, default=200)
+    parser.add_argument('--window', type=float, default=2.0)
+    args = parser.parse_args()
+
+    latencies = []
+    done = threading.Event()
+
+    def on_due(item):
+        latencies.append(time.time() - item['due'])
+        if len(latencies) >= args.fires:
+            done.set()
+
+    scheduler = ReminderScheduler(on_due)
+    now = time.time()
+    far = [(now + 86400 + i, {'due': now + 86400 + i}) for i in range(args.pending)]
+
+    start = time.perf_counter()
+    scheduler.schedule_many(far)
+    print(f"bulk load of {args.pending} pending reminders: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    scheduler.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    base = time.time() + 0.2
+    step = args.window / args.fires
+    insert_start = time.perf_counter()
+    for i in range(args.fires):
+        due = base + i * step
+        scheduler.schedule(due, {'due': due})
+    insert_cost = (time.perf_counter() - insert_start) / args.fires
+    done.wait(args.window + 10)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    scheduler.stop(1)
+
+    latencies.sort()
+    print(f"insert: {insert_cost * 1e6:.1f} us/reminder with {scheduler.pending()} pending")
+    print(f"fired {len(latencies)} reminders over {wall:.2f}s wall, {cpu * 1000:.1f} ms CPU")
+    print(f"fire latency p50={statistics.median(latencies) * 1000:.2f} ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms "
+          f"max={latencies[-1] * 1000:.2f} ms")
+
+    idle_start = time.process_time()
+    time.sleep(1)
+    print(f"idle CPU with {scheduler.pending()} pending: {(time.process_time() - idle_start) * 1000:.2f} ms/s")
+
+    legacy = [{'datetime': (datetime.now() + timedelta(days=1)).strftime(REMINDER_TIME_FORMAT), 'sent': False}
+              for _ in range(args.pending)]
+    scan_start = time.process_time()
+    legacy_scan(legacy, datetime.now())
+    print(f"legacy polling: {(time.process_time() - scan_start) * 1000:.1f} ms CPU per 30s tick, "
+          f"up to 30000 ms fire latency")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+# Load test for the chat and image endpoints against a local mock upstream.
+#
+# Starts a mock Hugging Face / Pollinations server that answers after --delay
+# seconds, starts the app (ASGI via uvicorn, gunicorn, or the threaded Flask
+# dev server) pointed at it, then fires --requests calls with --concurrency in
+# flight. --workers takes a list and runs once per worker count, so the
+# scaling across processes shows up side by side; the "intent" endpoint is
+# CPU-bound (no upstream) and is the one to scale with.
+#
+#   python benchmarks/load_test.py --server asgi --concurrency 500 --requests 2000
+#   python benchmarks/load_test.py --server flask --concurrency 500 --requests 2000
+#   python benchmarks/load_test.py --server gunicorn --endpoint intent --workers 1,2,4
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every capped route is started with this cap so check_body_limits can send
+# it a chunked body over the cap, which no Content-Length check can catch.
+BODY_LIMIT = 65536
+BODY_LIMIT_ROUTES = ['/api/chat', '/api/reminders/bulk', '/api/finetune/prepare',
+                     '/api/finetune/analyze', '/api/finetune/test']
+
+
+async def mock_upstream(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    while True:
+        message = await receive()
+        if not message.get('more_body', False):
+            break
+    await asyncio.sleep(float(os.environ.get('MOCK_DELAY', '1.0')))
+    if scope['method'] == 'POST':
+        body = json.dumps([{'generated_text': 'Mock reply from the upstream model.'}]).encode('utf-8')
+        content_type = b'application/json'
+    else:
+        body = os.urandom(int(os.environ.get('MOCK_IMAGE_BYTES', '50000')))
+        content_type = b'image/jpeg'
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def wait_for_port(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_processes(args, workers, state_dir):
+    # Every request comes from one address, so per-client rate limits are off.
+    env = dict(os.environ, MOCK_DELAY=str(args.delay), PYTHONPATH=ROOT, RATE_LIMIT_ENABLED='0')
+    env['MAX_CONTENT_LENGTHS'] = json.dumps({route: BODY_LIMIT for route in BODY_LIMIT_ROUTES})
+    # Workers share one SQLite store and leader lock, as in production.
+    env['REMINDER_STORE'] = 'sqlite'
+    env['REMINDER_DB'] = os.path.join(state_dir, 'reminders.db')
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    env['UPSTREAM_HUGGINGFACE_URL'] = mock_url + '/models/'
+    env['UPSTREAM_POLLINATIONS_URL'] = mock_url + '/prompt/'
+    env['UPSTREAM_HUGGINGFACE_MAX_CONCURRENCY'] = str(args.upstream_concurrency)
+    env['UPSTREAM_POLLINATIONS_MAX_CONCURRENCY'] = str(args.upstream_concurrency)
+    env['UPSTREAM_POOL_SIZE'] = str(args.upstream_concurrency)
+
+    mock = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.load_test:mock_upstream',
+         '--port', str(args.mock_port), '--log-level', 'warning', '--backlog', '4096'],
+        cwd=ROOT, env=env
+    )
+    if args.server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(args.port),
+                   '--log-level', 'warning', '--backlog', '4096', '--workers', str(workers)]
+    elif args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app',
+                   '--bind', f"127.0.0.1:{args.port}", '--workers', str(workers),
+                   '--backlog', '4096', '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-c',
+                   f"import server; server.app.run(port={args.port}, threaded=True)"]
+    app = subprocess.Popen(command, cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+    wait_for_port(mock_url + '/')
+    wait_for_port(f"http://127.0.0.1:{args.port}/health")
+    return mock, app
+
+
+async def check_scheduler_leader(args, workers):
+    # Every worker answers /health with its pid and scheduler status; exactly
+    # one of them should be running the scheduler.
+    url = f"http://127.0.0.1:{args.port}/health"
+    pids = {}
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as session:
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            for _ in range(max(20, workers * 10)):
+                async with session.get(url) as response:
+                    scheduler = (await response.json())['checks']['scheduler']
+                    pids[scheduler['pid']] = scheduler['status']
+            if len(pids) >= workers and 'running' in pids.values():
+                break
+            await asyncio.sleep(0.5)
+    leaders = [pid for pid, status in pids.items() if status == 'running']
+    print(f"workers seen: {len(pids)}/{workers}, running the scheduler: {len(leaders)}")
+
+
+def over_limit_body(route):
+    # (content type, body a little over BODY_LIMIT) in the format the route reads.
+    if route == '/api/reminders/bulk':
+        line = json.dumps({'message': 'Remind me to stretch tomorrow at 9am', 'email': 'load@example.com'})
+        return 'application/x-ndjson', ((line + '\n') * (BODY_LIMIT // len(line) + 10)).encode('utf-8')
+    if route == '/api/chat':
+        return 'application/json', json.dumps({'message': 'x' * (BODY_LIMIT + 1000)}).encode('utf-8')
+    if route == '/api/finetune/test':
+        return 'application/json', json.dumps({'prompts': ['hello'] * (BODY_LIMIT // 8)}).encode('utf-8')
+    line = json.dumps({'messages': [{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'hello'}]})
+    return 'application/jsonl', ((line + '\n') * (BODY_LIMIT // len(line) + 10)).encode('utf-8')
+
+
+async def check_body_limits(args):
+    # Chunked bodies carry no Content-Length, so the cap only trips while the
+    # route reads them. Expect a JSON 413, or for the NDJSON bulk import
+    # (whose response has already started) an error line before the summary.
+    url = f"http://127.0.0.1:{args.port}"
+    async with aiohttp.ClientSession(url, connector=aiohttp.TCPConnector(force_close=True)) as session:
+        for route in BODY_LIMIT_ROUTES:
+            content_type, body = over_limit_body(route)
+
+            async def chunks():
+                for i in range(0, len(body), 8192):
+                    yield body[i:i + 8192]
+
+            try:
+                async with session.post(route, data=chunks(), headers={'Content-Type': content_type},
+                                        timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    text = await response.text()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"body limit {route}: FAIL ({e!r})")
+                continue
+            if route == '/api/reminders/bulk':
+                lines = [json.loads(line) for line in text.splitlines() if line.strip()]
+                ok = (status == 200 and len(lines) >= 2 and 'summary' in lines[-1]
+                      and lines[-2].get('success') is False and 'too large' in lines[-2].get('error', ''))
+            else:
+                ok = status == 413 and 'too large' in text
+            print(f"body limit {route}: {'ok' if ok else 'FAIL'} ({status})")
+
+
+async def run_load(args):
+    url = f"http://127.0.0.1:{args.port}"
+    latencies = []
+    failures = 0
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(url, connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        async def worker():
+            nonlocal failures
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if args.endpoint == 'chat':
+                    path, payload = '/api/chat', {'message': f"question {i}"}
+                elif args.endpoint == 'intent':
+                    path, payload = '/api/finetune/test', {'message': f"How do I reset my password? ({i})"}
+                else:
+                    path, payload = '/api/generate-image', {'prompt': f"prompt {i}"}
+                start = time.perf_counter()
+                try:
+                    async with session.post(path, json=payload) as response:
+                        await response.read()
+                        if response.status != 200:
+                            failures += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    failures += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{args.requests} requests in {elapsed:.2f}s -> {args.requests / elapsed:.1f} req/s, {failures} failures")
+    print(f"latency p50={statistics.median(latencies):.3f}s "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1]:.3f}s max={latencies[-1]:.3f}s")
+    return args.requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', choices=['asgi', 'gunicorn', 'flask'], default='asgi')
+    parser.add_argument('--endpoint', choices=['chat', 'image', 'intent'], default='chat')
+    parser.add_argument('--workers', default='1', help='comma-separated worker counts (asgi/gunicorn)')
+    parser.add_argument('--concurrency', type=int, default=300)
+    parser.add_argument('--requests', type=int, default=1500)
+    parser.add_argument('--delay', type=float, default=1.0)
+    parser.add_argument('--upstream-concurrency', type=int, default=512)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--mock-port', type=int, default=5056)
+    args = parser.parse_args()
+
+    worker_counts = [int(w) for w in args.workers.split(',')]
+    if args.server == 'flask':
+        worker_counts = [1]
+    print(f"server={args.server} endpoint={args.endpoint} concurrency={args.concurrency} "
+          f"upstream_delay={args.delay}s cpu_count={os.cpu_count()}")
+    baseline = None
+    for workers in worker_counts:
+        print(f"--- workers={workers}")
+        with tempfile.TemporaryDirectory() as state_dir:
+            mock, app = start_processes(args, workers, state_dir)
+            try:
+                if args.server != 'flask':
+                    asyncio.run(check_scheduler_leader(args, workers))
+                asyncio.run(check_body_limits(args))
+                throughput = asyncio.run(run_load(args))
+            finally:
+                app.terminate()
+                mock.terminate()
+                app.wait()
+                mock.wait()
+        baseline = baseline or throughput
+        print(f"speedup vs workers={worker_counts[0]}: {throughput / baseline:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
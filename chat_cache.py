@@ -0,0 +1,129 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from singleflight import AsyncSingleFlight, SingleFlight
+from upstream import env_float, env_int
+
+WHITESPACE = re.compile(r'\s+')
+TRAILING_PUNCTUATION = re.compile(r'[\s.!?]+$')
+
+
+def normalise_message(message):
+    message = WHITESPACE.sub(' ', message).strip().lower()
+    return TRAILING_PUNCTUATION.sub('', message)
+
+
+def chat_cache_key(message, model, parameters):
+    raw = json.dumps([model, parameters, normalise_message(message)], sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ChatResponseCache:
+    # TTL + LRU cache of upstream chat replies. Each entry remembers how long
+    # the upstream took to produce it so hits can report the latency saved.
+
+    def __init__(self, max_entries=None, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries if max_entries is not None else env_int('CHAT_CACHE_MAX_ENTRIES', 1024)
+        self.ttl = ttl if ttl is not None else env_float('CHAT_CACHE_TTL', 600)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'bypassed': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+        self.saved_upstream_ms = 0.0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, latency_ms, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.counters['expirations'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            self.saved_upstream_ms += latency_ms
+            return value
+
+    def put(self, key, value, latency_ms):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, latency_ms, self._clock() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get_or_fetch(self, key, fetch, bypass=False):
+        # fetch() returns (reply, cacheable); fallback replies come back with
+        # cacheable=False so an upstream outage is never cached.
+        if bypass:
+            self._count('bypassed')
+        else:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+        def fetch_and_store():
+            start = time.perf_counter()
+            value, cacheable = fetch()
+            if cacheable:
+                self.put(key, value, (time.perf_counter() - start) * 1000)
+            return value
+
+        if bypass:
+            return fetch_and_store()
+        value, shared = self._flights.do(key, fetch_and_store)
+        self._count('coalesced' if shared else 'misses')
+        return value
+
+    async def get_or_fetch_async(self, key, fetch, bypass=False):
+        if bypass:
+            self._count('bypassed')
+        else:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+        async def fetch_and_store():
+            start = time.perf_counter()
+            value, cacheable = await fetch()
+            if cacheable:
+                self.put(key, value, (time.perf_counter() - start) * 1000)
+            return value
+
+        if bypass:
+            return await fetch_and_store()
+        value, shared = await self._async_flights.do(key, fetch_and_store)
+        self._count('coalesced' if shared else 'misses')
+        return value
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot['entries'] = len(self._entries)
+            saved = self.saved_upstream_ms
+        lookups = snapshot['hits'] + snapshot['misses'] + snapshot['coalesced']
+        served = snapshot['hits'] + snapshot['coalesced']
+        snapshot['hit_ratio'] = round(served / lookups, 4) if lookups else 0.0
+        snapshot['saved_upstream_ms'] = round(saved, 2)
+        return snapshot
@@ -0,0 +1,368 @@
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from finetune_data import READ_CHUNK_BYTES, VALID_ROLES, validate_example
+from singleflight import SingleFlight
+from upstream import env_float, env_int
+
+# MinHash over 3-word shingles of the user/assistant turns (the system prompt
+# is usually shared by every example, so it would only add noise). One hash
+# per shingle is split into NUM_BINS bins (one-permutation hashing), and LSH
+# groups BANDS x ROWS of the signature: pairs above ~0.85 Jaccard similarity
+# share a band with high probability.
+SHINGLE_WORDS = 3
+NUM_BINS = 32
+BANDS = 4
+ROWS = NUM_BINS // BANDS
+BIN_BITS = 5
+EMPTY_BIN = 1 << 32
+CHUNK_SIZE = 1000
+MAX_DUPLICATE_SAMPLES = 20
+MAX_INVALID_SAMPLES = 20
+
+# Default-epoch heuristic used by OpenAI's fine-tuning data-prep guide.
+TARGET_EPOCHS = 3
+MIN_TARGET_EXAMPLES = 100
+MAX_TARGET_EXAMPLES = 25000
+MIN_DEFAULT_EPOCHS = 1
+MAX_DEFAULT_EPOCHS = 25
+
+WORD = re.compile(r'\w+')
+DENSIFY_PROBES = [random.Random(b).sample(range(NUM_BINS), NUM_BINS) for b in range(NUM_BINS)]
+
+
+def minhash_signature(text):
+    words = WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    signature = [EMPTY_BIN] * NUM_BINS
+    for shingle in shingles:
+        # crc32 is linear, so similar shingles get correlated hashes; the
+        # murmur3 finaliser mixes them into independent-looking values.
+        h = zlib.crc32(shingle.encode('utf-8'))
+        h ^= h >> 16
+        h = (h * 0x85ebca6b) & 0xffffffff
+        h ^= h >> 13
+        h = (h * 0xc2b2ae35) & 0xffffffff
+        h ^= h >> 16
+        b = h & (NUM_BINS - 1)
+        v = h >> BIN_BITS
+        if v < signature[b]:
+            signature[b] = v
+    # Empty bins borrow from a non-empty bin picked by a fixed per-bin probe
+    # order ("optimal densification"); borrowing from the neighbour instead
+    # would let one shared shingle fill a whole band.
+    filled = signature[:]
+    for b in range(NUM_BINS):
+        if signature[b] == EMPTY_BIN:
+            for source in DENSIFY_PROBES[b]:
+                if signature[source] != EMPTY_BIN:
+                    filled[b] = signature[source]
+                    break
+    signature = filled
+    return signature
+
+
+def band_keys(signature):
+    # Hashes of int tuples don't depend on PYTHONHASHSEED, so keys computed
+    # in different worker processes are comparable.
+    return tuple(hash((band,) + tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS))
+
+
+def analyse_chunk(examples):
+    # Runs in a worker process. Returns per-chunk aggregates plus the compact
+    # per-example keys the parent needs for duplicate detection.
+    tokens = array('I')
+    exact = []
+    bands = []
+    invalid = []
+    roles = dict.fromkeys(VALID_ROLES, 0)
+    messages = 0
+    for position, example in enumerate(examples):
+        errors, count = validate_example(example) if example is not None else (['Invalid JSON'], 0)
+        if errors:
+            tokens.append(0)
+            exact.append(None)
+            bands.append(None)
+            invalid.append((position, errors[0]))
+            continue
+        tokens.append(count)
+        turns = example['messages']
+        messages += len(turns)
+        for message in turns:
+            roles[message['role']] += 1
+        canonical = json.dumps(turns, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        exact.append(int.from_bytes(hashlib.blake2b(canonical, digest_size=8).digest(), 'big'))
+        text = ' '.join(message['content'] for message in turns if message['role'] != 'system')
+        bands.append(band_keys(minhash_signature(text)))
+    return {
+        'tokens': tokens,
+        'exact': exact,
+        'bands': bands,
+        'invalid': invalid,
+        'roles': roles,
+        'messages': messages
+    }
+
+
+def default_epochs(n_examples):
+    if n_examples == 0:
+        return 0
+    if n_examples * TARGET_EPOCHS < MIN_TARGET_EXAMPLES:
+        return min(MAX_DEFAULT_EPOCHS, MIN_TARGET_EXAMPLES // n_examples)
+    if n_examples * TARGET_EPOCHS > MAX_TARGET_EXAMPLES:
+        return max(MIN_DEFAULT_EPOCHS, MAX_TARGET_EXAMPLES // n_examples)
+    return TARGET_EPOCHS
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+class DatasetAnalysis:
+    # Folds chunk results together in dataset order, so "duplicate_of" always
+    # points at the first occurrence.
+
+    def __init__(self):
+        self.total = 0
+        self.tokens = array('I')
+        self.duplicate = bytearray()
+        self.roles = dict.fromkeys(VALID_ROLES, 0)
+        self.messages = 0
+        self.invalid = 0
+        self.invalid_samples = []
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.duplicate_samples = []
+        self._exact_seen = {}
+        self._band_seen = {}
+
+    def add_chunk(self, result):
+        offset = self.total
+        self.total += len(result['tokens'])
+        self.tokens.extend(result['tokens'])
+        self.messages += result['messages']
+        for role, count in result['roles'].items():
+            self.roles[role] += count
+        self.invalid += len(result['invalid'])
+        for position, error in result['invalid']:
+            if len(self.invalid_samples) < MAX_INVALID_SAMPLES:
+                self.invalid_samples.append(f"Example {offset + position}: {error}")
+
+        exact_seen = self._exact_seen
+        band_seen = self._band_seen
+        for position, (key, bands) in enumerate(zip(result['exact'], result['bands'])):
+            index = offset + position
+            if key is None:
+                self.duplicate.append(0)
+                continue
+            first = exact_seen.get(key)
+            if first is not None:
+                self.exact_duplicates += 1
+                self.duplicate.append(1)
+                self._sample(index, first, 'exact')
+                continue
+            exact_seen[key] = index
+            match = None
+            for band in bands:
+                first = band_seen.setdefault(band, index)
+                if match is None and first != index:
+                    match = first
+            if match is not None:
+                self.near_duplicates += 1
+                self.duplicate.append(1)
+                self._sample(index, match, 'near')
+            else:
+                self.duplicate.append(0)
+
+    def _sample(self, index, first, kind):
+        if len(self.duplicate_samples) < MAX_DUPLICATE_SAMPLES:
+            self.duplicate_samples.append({'index': index, 'duplicate_of': first, 'kind': kind})
+
+    def cost(self, billed_tokens, examples, epochs, price_per_million):
+        epochs = epochs or default_epochs(examples)
+        return {
+            'examples': examples,
+            'billing_tokens_per_epoch': billed_tokens,
+            'epochs': epochs,
+            'training_tokens': billed_tokens * epochs,
+            'estimated_cost_usd': round(billed_tokens * epochs * price_per_million / 1e6, 4)
+        }
+
+    def result(self, epochs=None, max_tokens=None, price_per_million=None):
+        max_tokens = max_tokens or env_int('FINETUNE_MAX_EXAMPLE_TOKENS', 4096)
+        price = price_per_million if price_per_million is not None else env_float('FINETUNE_PRICE_PER_1M_TOKENS', 8.0)
+        valid = self.total - self.invalid
+        counts = sorted(t for t in self.tokens if t)
+        billed = sum(min(t, max_tokens) for t in counts)
+        unique_billed = 0
+        unique = 0
+        for tokens, duplicate in zip(self.tokens, self.duplicate):
+            if tokens and not duplicate:
+                unique += 1
+                unique_billed += min(tokens, max_tokens)
+        return {
+            'total_examples': self.total,
+            'valid_examples': valid,
+            'invalid_examples': self.invalid,
+            'invalid_samples': self.invalid_samples,
+            'tokens': {
+                'total': sum(counts),
+                'min': counts[0] if counts else 0,
+                'mean': round(sum(counts) / len(counts), 1) if counts else 0,
+                'p50': percentile(counts, 50),
+                'p90': percentile(counts, 90),
+                'p99': percentile(counts, 99),
+                'max': counts[-1] if counts else 0,
+                'over_limit': len(counts) - sum(1 for t in counts if t <= max_tokens)
+            },
+            'roles': self.roles,
+            'messages_per_example': round(self.messages / valid, 2) if valid else 0,
+            'duplicates': {
+                'exact': self.exact_duplicates,
+                'near': self.near_duplicates,
+                'samples': self.duplicate_samples
+            },
+            'cost': {
+                'price_per_1m_tokens': price,
+                'dataset': self.cost(billed, valid, epochs, price),
+                'deduplicated': self.cost(unique_billed, unique, epochs, price)
+            }
+        }
+
+
+analysis_pool = None
+analysis_pool_workers = 0
+analysis_pool_lock = threading.Lock()
+
+
+def get_analysis_pool(workers):
+    global analysis_pool, analysis_pool_workers
+    with analysis_pool_lock:
+        if analysis_pool is None or analysis_pool_workers != workers:
+            if analysis_pool is not None:
+                analysis_pool.shutdown(wait=False)
+            analysis_pool = ProcessPoolExecutor(max_workers=workers)
+            analysis_pool_workers = workers
+        return analysis_pool
+
+
+def iter_example_chunks(examples, chunk_size):
+    chunk = []
+    for _, example, error in examples:
+        chunk.append(example if error is None else None)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyse_examples(examples, workers=None, chunk_size=CHUNK_SIZE):
+    # examples yields (index, example, error) as produced by finetune_data's
+    # readers. Chunks go to a process pool with a bounded number in flight,
+    # so the dataset is never fully materialised in the parent either.
+    workers = workers if workers is not None else env_int('FINETUNE_ANALYSIS_WORKERS', os.cpu_count() or 1)
+    analysis = DatasetAnalysis()
+    chunks = iter_example_chunks(examples, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            analysis.add_chunk(analyse_chunk(chunk))
+        return analysis
+
+    first = next(chunks, None)
+    if first is None:
+        return analysis
+    if len(first) < chunk_size:
+        # Too small to be worth shipping to another process.
+        analysis.add_chunk(analyse_chunk(first))
+        return analysis
+    pool = get_analysis_pool(workers)
+    in_flight = deque([pool.submit(analyse_chunk, first)])
+    for chunk in chunks:
+        in_flight.append(pool.submit(analyse_chunk, chunk))
+        if len(in_flight) >= workers * 2:
+            analysis.add_chunk(in_flight.popleft().result())
+    while in_flight:
+        analysis.add_chunk(in_flight.popleft().result())
+    return analysis
+
+
+def spool_stream(stream, max_memory=None):
+    # Copies an upload into a spooled temp file while hashing it, so repeated
+    # submissions can be answered from the cache before any JSON is parsed.
+    max_memory = max_memory or env_int('FINETUNE_SPOOL_MEMORY_BYTES', 16 << 20)
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return digest.hexdigest(), spool
+
+
+class AnalysisCache:
+    # Small LRU of finished analyses keyed by dataset hash and parameters.
+    # Concurrent submissions of the same dataset share one computation.
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries if max_entries is not None else env_int('FINETUNE_ANALYSIS_CACHE_SIZE', 32)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = SingleFlight()
+        self.counters = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        # Returns (value, cached).
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        def compute_and_store():
+            value = compute()
+            self.put(key, value)
+            return value
+
+        value, shared = self._flights.do(key, compute_and_store)
+        with self._lock:
+            self.counters['coalesced' if shared else 'misses'] += 1
+        return value, shared
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot['entries'] = len(self._entries)
+        return snapshot
@@ -0,0 +1,259 @@
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from collections import deque
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from scheduler import ReminderScheduler
+from upstream import env_float, env_int
+
+
+def build_reminder_message(reminder, sender):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = reminder['email']
+    msg['Subject'] = f"Reminder: {reminder['task']}"
+    body = (
+        f"Hi!\n\nThis is your reminder to: {reminder['task']}\n"
+        f"Scheduled for: {reminder['datetime']}\n\n"
+        "Sent by your AI Reminder Agent."
+    )
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+class ConsoleBackend:
+    # Default when no SMTP server is configured: log instead of sending.
+
+    def send_batch(self, reminders):
+        for reminder in reminders:
+            print(f"📧 Sending reminder email to {reminder['email']}")
+            print(f"Task: {reminder['task']}")
+            print(f"Time: {reminder['datetime']}")
+        return [None] * len(reminders)
+
+    def close(self):
+        pass
+
+
+class SMTPBackend:
+    # One instance per worker thread. The SMTP session stays open across
+    # batches and is only re-established after an error or a long idle gap.
+
+    def __init__(self, host, port=25, username=None, password=None, starttls=False,
+                 sender='reminders@localhost', timeout=30, idle_check=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+
+    def _ensure_connection(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_check:
+            try:
+                self._smtp.noop()
+            except smtplib.SMTPException:
+                self._drop()
+        if self._smtp is None:
+            self._connect()
+
+    def _drop(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.close()
+            except Exception:
+                pass
+        self._smtp = None
+
+    def send_batch(self, reminders):
+        # Returns one entry per reminder: None on success, otherwise the error.
+        errors = []
+        try:
+            self._ensure_connection()
+        except (smtplib.SMTPException, OSError) as e:
+            self._drop()
+            return [e] * len(reminders)
+        for reminder in reminders:
+            try:
+                message = build_reminder_message(reminder, self.sender)
+                self._smtp.sendmail(self.sender, [reminder['email']], message.as_string())
+                errors.append(None)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                # Rejected message on a healthy session: only this reminder is retried.
+                errors.append(e)
+            except (smtplib.SMTPException, OSError) as e:
+                # The session is unusable; fail the rest of the batch so it is retried.
+                self._drop()
+                errors.extend([e] * (len(reminders) - len(errors)))
+                break
+        self._last_used = time.monotonic()
+        return errors
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+        self._smtp = None
+
+
+def backend_factory_from_env():
+    host = os.environ.get('SMTP_HOST')
+    if not host:
+        return ConsoleBackend
+    starttls = os.environ.get('SMTP_STARTTLS', '').lower() in ('1', 'true', 'yes')
+    settings = {
+        'host': host,
+        'port': env_int('SMTP_PORT', 587 if starttls else 25),
+        'username': os.environ.get('SMTP_USERNAME') or None,
+        'password': os.environ.get('SMTP_PASSWORD') or None,
+        'starttls': starttls,
+        'sender': os.environ.get('SMTP_FROM', 'reminders@localhost'),
+        'timeout': env_float('SMTP_TIMEOUT', 30)
+    }
+    return lambda: SMTPBackend(**settings)
+
+
+class EmailDeliveryService:
+    # Reminders are queued by the scheduler and drained by a pool of worker
+    # threads. A worker takes whatever is already queued (up to batch_size)
+    # and sends it over its own persistent connection. Failures are retried
+    # with jittered exponential backoff; after max_attempts the reminder is
+    # dead-lettered.
+
+    def __init__(self, backend_factory=None, on_sent=None, on_dead_letter=None, workers=None,
+                 batch_size=None, max_attempts=None, backoff=None, max_backoff=None):
+        self.backend_factory = backend_factory or backend_factory_from_env()
+        self.on_sent = on_sent
+        self.on_dead_letter = on_dead_letter
+        self.workers = workers if workers is not None else env_int('EMAIL_WORKERS', 2)
+        self.batch_size = batch_size if batch_size is not None else env_int('EMAIL_BATCH_SIZE', 50)
+        self.max_attempts = max_attempts if max_attempts is not None else env_int('EMAIL_MAX_ATTEMPTS', 5)
+        self.backoff = backoff if backoff is not None else env_float('EMAIL_RETRY_BACKOFF', 2)
+        self.max_backoff = max_backoff if max_backoff is not None else env_float('EMAIL_RETRY_MAX_BACKOFF', 300)
+        self._queue = queue.Queue()
+        self._retries = ReminderScheduler(self._queue.put)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.dead_letters = deque(maxlen=1000)
+        self.counters = {'sent': 0, 'failed_attempts': 0, 'retried': 0, 'dead_lettered': 0, 'batches': 0}
+
+    def submit(self, reminder):
+        self._queue.put((reminder, 1))
+
+    def start(self):
+        if self._threads:
+            return
+        self._retries.start()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'email-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._retries.stop(timeout)
+
+    def alive_workers(self):
+        return sum(1 for thread in self._threads if thread.is_alive())
+
+    def queue_depth(self):
+        return self._queue.qsize() + self._retries.pending()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _take_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Keep the shutdown marker for the next _take_batch call.
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _worker(self):
+        backend = self.backend_factory()
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch is None:
+                    return
+                self._deliver(backend, batch)
+        finally:
+            backend.close()
+
+    def _deliver(self, backend, batch):
+        self._count('batches')
+        try:
+            errors = backend.send_batch([reminder for reminder, _ in batch])
+        except Exception as e:
+            errors = [e] * len(batch)
+        sent = []
+        for (reminder, attempt), error in zip(batch, errors):
+            if error is None:
+                sent.append(reminder)
+            else:
+                self._retry_or_dead_letter(reminder, attempt, error)
+        if sent:
+            self._count('sent', len(sent))
+            if self.on_sent is not None:
+                try:
+                    self.on_sent(sent)
+                except Exception as e:
+                    print(f"Error recording sent reminders: {str(e)}")
+
+    def _retry_or_dead_letter(self, reminder, attempt, error):
+        self._count('failed_attempts')
+        if attempt >= self.max_attempts:
+            print(f"Error sending email to {reminder['email']} after {attempt} attempts: {str(error)}")
+            self._count('dead_lettered')
+            self.dead_letters.append({'reminder': reminder, 'error': str(error), 'attempts': attempt})
+            if self.on_dead_letter is not None:
+                try:
+                    self.on_dead_letter(reminder, error)
+                except Exception as e:
+                    print(f"Error recording dead-lettered reminder: {str(e)}")
+            return
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** (attempt - 1))))
+        self._count('retried')
+        self._retries.schedule(time.time() + delay, (reminder, attempt + 1))
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+        snapshot['queued'] = self._queue.qsize()
+        snapshot['retry_pending'] = self._retries.pending()
+        snapshot['dead_letter_size'] = len(self.dead_letters)
+        return snapshot
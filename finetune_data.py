@@ -0,0 +1,240 @@
+import codecs
+import io
+import json
+import re
+
+from upstream import env_int
+
+VALID_ROLES = ('system', 'user', 'assistant')
+PREVIEW_CHARS = 500
+READ_CHUNK_BYTES = 65536
+# Rough chat-format token estimate: ~4 characters per token plus a few
+# tokens of per-message framing.
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+
+NON_WHITESPACE = re.compile(r'\S')
+JSON_DECODER = json.JSONDecoder()
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def validate_example(example):
+    # Returns (errors, estimated_tokens) for one chat-format example.
+    if not isinstance(example, dict) or 'messages' not in example:
+        return ["Missing 'messages' field"], 0
+    messages = example['messages']
+    if not isinstance(messages, list):
+        return ["'messages' must be a list"], 0
+    if len(messages) < 2:
+        return ["Need at least 2 messages (user + assistant)"], 0
+
+    errors = []
+    tokens = 0
+    expected = 'user'
+    for position, message in enumerate(messages):
+        if not isinstance(message, dict):
+            errors.append(f"Message {position}: must be an object")
+            continue
+        role = message.get('role')
+        content = message.get('content')
+        if role not in VALID_ROLES:
+            errors.append(f"Message {position}: invalid role {role!r}")
+        elif role == 'system':
+            if position != 0:
+                errors.append(f"Message {position}: 'system' is only allowed as the first message")
+        elif role != expected:
+            errors.append(f"Message {position}: expected '{expected}' but got '{role}'")
+        else:
+            expected = 'assistant' if role == 'user' else 'user'
+        if not isinstance(content, str) or not content.strip():
+            errors.append(f"Message {position}: content must be a non-empty string")
+        else:
+            tokens += estimate_tokens(content) + TOKENS_PER_MESSAGE
+    if isinstance(messages[-1], dict) and messages[-1].get('role') != 'assistant':
+        errors.append("Last message must be from the assistant")
+    return errors, tokens
+
+
+class DatasetValidator:
+    # Consumes examples one at a time and keeps only counters, the first
+    # max_errors errors and the first PREVIEW_CHARS of the JSONL output, so
+    # memory stays flat no matter how large the upload is.
+
+    def __init__(self, max_errors=None, max_tokens=None, preview_chars=PREVIEW_CHARS):
+        self.max_errors = max_errors if max_errors is not None else env_int('FINETUNE_MAX_ERRORS', 50)
+        self.max_tokens = max_tokens if max_tokens is not None else env_int('FINETUNE_MAX_EXAMPLE_TOKENS', 4096)
+        self.preview_chars = preview_chars
+        self.total = 0
+        self.invalid = 0
+        self.total_tokens = 0
+        self.max_example_tokens = 0
+        self.errors = []
+        self.error_limit_reached = False
+        self._preview = []
+        self._preview_length = 0
+        self._preview_truncated = False
+
+    def add(self, index, example, error=None):
+        # Returns False once the error cap is hit so callers can stop reading.
+        self.total += 1
+        if error is not None:
+            errors, tokens = [error], 0
+        else:
+            errors, tokens = validate_example(example)
+            if not errors and tokens > self.max_tokens:
+                errors = [f"Estimated {tokens} tokens exceeds the {self.max_tokens} token limit"]
+        if errors:
+            self.invalid += 1
+            for message in errors[:self.max_errors - len(self.errors)]:
+                self.errors.append(f"Example {index}: {message}")
+            self.error_limit_reached = len(self.errors) >= self.max_errors
+            return not self.error_limit_reached
+        self.total_tokens += tokens
+        self.max_example_tokens = max(self.max_example_tokens, tokens)
+        self._add_preview(example)
+        return True
+
+    def _add_preview(self, example):
+        if self._preview_truncated:
+            return
+        line = json.dumps(example)
+        separator = 1 if self._preview else 0
+        self._preview.append(line)
+        self._preview_length += separator + len(line)
+        if self._preview_length > self.preview_chars:
+            self._preview_truncated = True
+
+    def preview(self):
+        content = '\n'.join(self._preview)
+        return content[:self.preview_chars] + '...' if self._preview_truncated else content
+
+    def summary(self):
+        return {
+            'total_examples': self.total,
+            'invalid_examples': self.invalid,
+            'estimated_tokens': self.total_tokens,
+            'max_example_tokens': self.max_example_tokens
+        }
+
+
+def iter_jsonl_examples(stream, max_line_bytes=None):
+    # Yields (index, example, error) per non-blank line.
+    max_line_bytes = max_line_bytes or env_int('FINETUNE_MAX_LINE_BYTES', 1 << 20)
+    reader = stream if hasattr(stream, 'peek') else io.BufferedReader(stream, buffer_size=READ_CHUNK_BYTES)
+    index = 0
+    while True:
+        line = reader.readline(max_line_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Skip the rest of the oversized line without buffering it.
+            while line and not line.endswith(b'\n'):
+                line = reader.readline(max_line_bytes)
+            yield index, None, f"Line longer than {max_line_bytes} bytes"
+            index += 1
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line), None
+        except ValueError:
+            yield index, None, 'Invalid JSON line'
+        index += 1
+
+
+def iter_json_array_examples(stream, max_element_bytes=None):
+    # Decodes a top-level JSON array one element at a time. Only the element
+    # currently being decoded is buffered.
+    max_element_bytes = max_element_bytes or env_int('FINETUNE_MAX_LINE_BYTES', 1 << 20)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + decoder.decode(chunk or b'', final=eof)
+        pos = 0
+
+    def next_token():
+        # Moves pos to the next non-whitespace character and returns it.
+        nonlocal pos
+        while True:
+            m = NON_WHITESPACE.search(buffer, pos)
+            if m:
+                pos = m.start()
+                return buffer[pos]
+            pos = len(buffer)
+            if eof:
+                return None
+            fill()
+
+    try:
+        if next_token() != '[':
+            yield 0, None, 'Body must be a JSON array of examples'
+            return
+        pos += 1
+        index = 0
+        while True:
+            token = next_token()
+            if token == ']' and index == 0:
+                return
+            while True:
+                try:
+                    example, end = JSON_DECODER.raw_decode(buffer, pos)
+                    # A scalar cut off at the chunk boundary decodes "successfully".
+                    if end < len(buffer) or eof or isinstance(example, (dict, list)):
+                        break
+                except ValueError:
+                    if eof:
+                        yield index, None, 'Invalid JSON'
+                        return
+                    if len(buffer) - pos > max_element_bytes:
+                        yield index, None, f"Example larger than {max_element_bytes} bytes"
+                        return
+                fill()
+            pos = end
+            yield index, example, None
+            index += 1
+            token = next_token()
+            if token == ']':
+                return
+            if token != ',':
+                yield index, None, "Expected ',' or ']' after example"
+                return
+            pos += 1
+    except UnicodeDecodeError:
+        yield 0, None, 'Body is not valid UTF-8'
+
+
+def iter_uploaded_examples(stream, wrapper_key=None):
+    # JSONL unless the body starts with '[' (a JSON array). With wrapper_key,
+    # a body starting with '{' is the legacy {"<wrapper_key>": [...]} payload;
+    # that one has to be decoded whole.
+    reader = stream if hasattr(stream, 'peek') else io.BufferedReader(stream, buffer_size=READ_CHUNK_BYTES)
+    if reader.peek(len(codecs.BOM_UTF8)).startswith(codecs.BOM_UTF8):
+        reader.read(len(codecs.BOM_UTF8))
+    head = reader.peek(READ_CHUNK_BYTES).lstrip()
+    if head.startswith(b'['):
+        yield from iter_json_array_examples(reader)
+    elif wrapper_key and head.startswith(b'{'):
+        try:
+            data = json.load(reader)
+        except ValueError:
+            yield 0, None, 'Invalid JSON'
+            return
+        examples = data.get(wrapper_key) if isinstance(data, dict) else None
+        if not isinstance(examples, list):
+            yield 0, None, f"'{wrapper_key}' must be a list of examples"
+            return
+        for index, example in enumerate(examples):
+            yield index, example, None
+    else:
+        yield from iter_jsonl_examples(reader)
@@ -0,0 +1,25 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Every worker runs the full app; the reminder scheduler runs in exactly one
+# of them (see SCHEDULER_MODE in server.py). Reminders need a store shared by
+# all workers, i.e. REMINDER_STORE=sqlite (the default).
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Threads per worker keep slow upstream calls and SSE streams from tying up
+# a whole process.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Image generation can take up to 30s upstream.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+# Import the app in each worker, not in the master: the leader-election and
+# scheduler threads must belong to a worker so they die (and fail over) with it.
+preload_app = False
+
+
+def worker_exit(server, worker):
+    from server import stop_reminder_services
+    stop_reminder_services()
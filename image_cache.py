@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from singleflight import AsyncSingleFlight, SingleFlight
+from upstream import env_int
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def prompt_key(prompt):
+    normalised = WHITESPACE.sub(' ', prompt).strip().lower()
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+class MemoryTier:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        evicted = 0
+        if len(data) > self.max_bytes:
+            return evicted
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, dropped = self._items.popitem(last=False)
+                self.size -= len(dropped)
+                evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskTier:
+    # One file per key. Recency is the file mtime, refreshed on every hit, so
+    # eviction drops the least recently used files until under budget.
+
+    def __init__(self, directory, max_bytes):
+        # Absolute, since callers hand these paths to send_file, which
+        # resolves relative ones against the app root rather than the cwd.
+        directory = os.path.abspath(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and not name.startswith('.'):
+                self._sizes[name] = os.path.getsize(path)
+        self.size = sum(self._sizes.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        if key not in self._sizes:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self._sizes.pop(key, 0)
+            return None
+
+    def find(self, key):
+        # Path of the cached file, or None. Picks up files written by other
+        # worker processes sharing the directory.
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        if key not in self._sizes:
+            with self._lock:
+                self.size += size - self._sizes.get(key, 0)
+                self._sizes[key] = size
+        return path
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self.size += len(data) - self._sizes.get(key, 0)
+            self._sizes[key] = len(data)
+            return self._evict()
+
+    def _evict(self):
+        if self.size <= self.max_bytes:
+            return 0
+        by_age = sorted(self._sizes, key=lambda k: self._mtime(k))
+        evicted = 0
+        for key in by_age:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self.size -= self._sizes.pop(key)
+            evicted += 1
+        return evicted
+
+    def _mtime(self, key):
+        try:
+            return os.path.getmtime(self._path(key))
+        except FileNotFoundError:
+            return 0
+
+    def __len__(self):
+        return len(self._sizes)
+
+
+class ImageCache:
+    def __init__(self, memory_bytes=None, disk_dir=None, disk_bytes=None):
+        if memory_bytes is None:
+            memory_bytes = env_int('IMAGE_CACHE_MEMORY_BYTES', 64 * 1024 * 1024)
+        if disk_dir is None:
+            disk_dir = os.environ.get('IMAGE_CACHE_DIR', 'image_cache')
+        if disk_bytes is None:
+            disk_bytes = env_int('IMAGE_CACHE_DISK_BYTES', 1024 * 1024 * 1024)
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = DiskTier(disk_dir, disk_bytes) if disk_dir else None
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is not None:
+            self._count('memory_hits')
+            return data
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                self._count('disk_hits')
+                self._count('memory_evictions', self.memory.put(key, data))
+                return data
+        return None
+
+    def locate(self, key):
+        # Returns the cached bytes, or the path of the on-disk copy so it can be
+        # streamed without loading it into memory, or None.
+        data = self.memory.get(key)
+        if data is not None:
+            self._count('memory_hits')
+            return data
+        path = self.disk.find(key) if self.disk is not None else None
+        if path is not None:
+            self._count('disk_hits')
+            return path
+        return None
+
+    def put(self, key, data):
+        self._count('memory_evictions', self.memory.put(key, data))
+        if self.disk is not None:
+            self._count('disk_evictions', self.disk.put(key, data))
+
+    def get_or_fetch(self, key, fetch):
+        # fetch() returns the image bytes, or None for a failure that should
+        # not be cached. Concurrent callers for the same key share one fetch.
+        data = self.get(key)
+        if data is not None:
+            return data
+
+        def fetch_and_store():
+            result = fetch()
+            if result is not None:
+                self.put(key, result)
+            return result
+
+        data, shared = self._flights.do(key, fetch_and_store)
+        self._count('coalesced' if shared else 'misses')
+        return data
+
+    async def get_or_fetch_async(self, key, fetch):
+        data = self.memory.get(key)
+        if data is not None:
+            self._count('memory_hits')
+            return data
+
+        async def fetch_and_store():
+            result = await asyncio.to_thread(self.get, key) if self.disk is not None else None
+            if result is None:
+                self._count('misses')
+                result = await fetch()
+                if result is not None:
+                    await asyncio.to_thread(self.put, key, result)
+            return result
+
+        data, shared = await self._async_flights.do(key, fetch_and_store)
+        if shared:
+            self._count('coalesced')
+        return data
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+        snapshot['memory_entries'] = len(self.memory)
+        snapshot['memory_bytes'] = self.memory.size
+        snapshot['disk_entries'] = len(self.disk) if self.disk is not None else 0
+        snapshot['disk_bytes'] = self.disk.size if self.disk is not None else 0
+        return snapshot
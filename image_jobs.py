@@ -0,0 +1,231 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+
+from upstream import env_float, env_int
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+MIN_PRIORITY, MAX_PRIORITY = -10, 10
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Image queue is full, please try again later')
+        self.retry_after = retry_after
+
+
+class ImageJob:
+    def __init__(self, job_id, prompt, priority):
+        self.id = job_id
+        self.prompt = prompt
+        self.priority = priority
+        self.status = QUEUED
+        self.error = None
+        self.requests = 1
+        self.sequence = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'error': self.error,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at
+        }
+
+
+class ImageJobQueue:
+    # Image generations queued by priority (higher first, FIFO within a
+    # priority) and run by a fixed pool of worker threads, which bounds the
+    # load on the upstream. A job's id is its prompt key, so submitting a
+    # prompt that is already queued or running joins that job instead of
+    # adding another. Beyond max_queued jobs, submit() raises QueueFull.
+    #
+    # run(job) does the work and returns True on success. Finished jobs are
+    # kept for job_ttl seconds so clients can still poll them.
+
+    def __init__(self, run, workers=None, max_queued=None, job_ttl=None, max_jobs=10000):
+        self.run = run
+        self.workers = workers if workers is not None else env_int('IMAGE_JOB_WORKERS', 4)
+        self.max_queued = max_queued if max_queued is not None else env_int('IMAGE_JOB_MAX_QUEUED', 100)
+        self.job_ttl = job_ttl if job_ttl is not None else env_float('IMAGE_JOB_TTL', 3600)
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._heap = []
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._waiting = set()
+        self._finished = deque()
+        self._running = 0
+        self._threads = []
+        self._avg_seconds = None
+        self.counters = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'cancelled': 0, 'completed': 0, 'failed': 0}
+
+    def _ensure_workers(self):
+        # Started on first use so every process that takes jobs has its own pool.
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'image-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job_id, prompt, priority=0):
+        # Returns (job, deduplicated).
+        priority = max(MIN_PRIORITY, min(MAX_PRIORITY, priority))
+        with self._lock:
+            self._ensure_workers()
+            job = self._jobs.get(job_id)
+            if job is not None and job.status not in FINISHED:
+                job.requests += 1
+                self.counters['deduplicated'] += 1
+                if job.status == QUEUED and priority > job.priority:
+                    # The old heap entry goes stale and is skipped when popped.
+                    job.priority = priority
+                    self._push(job)
+                    self._changed.notify_all()
+                return job, True
+            if len(self._waiting) >= self.max_queued:
+                self.counters['rejected'] += 1
+                raise QueueFull(self._retry_after())
+            self._prune()
+            job = ImageJob(job_id, prompt, priority)
+            self._jobs[job_id] = job
+            self._waiting.add(job)
+            self._push(job)
+            self.counters['submitted'] += 1
+            self._changed.notify_all()
+            return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        # Withdraws one request for a queued job; the job is cancelled once
+        # every request that joined it has withdrawn. Returns the job, or
+        # None if it doesn't exist. Running and finished jobs are unaffected.
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return job
+            job.requests -= 1
+            if job.requests <= 0:
+                self._waiting.discard(job)
+                self._finish(job, CANCELLED)
+                self.counters['cancelled'] += 1
+            return job
+
+    def position(self, job):
+        # Number of queued jobs that will start before this one.
+        with self._lock:
+            return self._position(job)
+
+    def _position(self, job):
+        if job.status != QUEUED:
+            return 0
+        return sum(1 for other in self._waiting
+                   if (-other.priority, other.sequence) < (-job.priority, job.sequence))
+
+    def wait(self, job, last_seen, timeout):
+        # Blocks until the job (or the queue ahead of it) changes from the
+        # last_seen status dict, or timeout. Returns the current status dict.
+        # The check and the wait happen under one hold of the lock, so a
+        # change can't slip in between them unnoticed.
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                current = self._status(job)
+                remaining = deadline - time.monotonic()
+                if current != last_seen or job.status in FINISHED or remaining <= 0:
+                    return current
+                self._changed.wait(remaining)
+
+    def status(self, job):
+        with self._lock:
+            return self._status(job)
+
+    def _status(self, job):
+        status = job.to_dict()
+        status['position'] = self._position(job)
+        status['requests'] = job.requests
+        return status
+
+    def _retry_after(self):
+        # Roughly how long until a queue slot frees up.
+        avg = self._avg_seconds or 5.0
+        return max(1, min(60, math.ceil(avg / max(1, self.workers))))
+
+    def _push(self, job):
+        job.sequence = next(self._sequence)
+        heapq.heappush(self._heap, (-job.priority, job.sequence, job))
+
+    def _prune(self):
+        # Finished jobs leave in the order they finished.
+        now = time.time()
+        while self._finished and (now - self._finished[0].finished_at > self.job_ttl or
+                                  len(self._jobs) >= self.max_jobs):
+            job = self._finished.popleft()
+            if self._jobs.get(job.id) is job:
+                del self._jobs[job.id]
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self._finished.append(job)
+        self._changed.notify_all()
+
+    def _take(self):
+        with self._lock:
+            while True:
+                while self._heap:
+                    _, sequence, job = heapq.heappop(self._heap)
+                    if job.status == QUEUED and job.sequence == sequence:
+                        job.status = RUNNING
+                        job.started_at = time.time()
+                        self._waiting.discard(job)
+                        self._running += 1
+                        self._changed.notify_all()
+                        return job
+                self._changed.wait()
+
+    def _worker(self):
+        while True:
+            job = self._take()
+            try:
+                ok = self.run(job)
+                error = None if ok else 'Failed to generate image'
+            except Exception as e:
+                print(f"Error running image job {job.id}: {str(e)}")
+                ok, error = False, str(e)
+            with self._lock:
+                self._running -= 1
+                elapsed = time.time() - job.started_at
+                self._avg_seconds = elapsed if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * elapsed
+                self.counters['completed' if ok else 'failed'] += 1
+                self._finish(job, DONE if ok else FAILED, error)
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._waiting)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot['queued'] = len(self._waiting)
+            snapshot['running'] = self._running
+            snapshot['workers'] = self.workers
+            snapshot['max_queued'] = self.max_queued
+            snapshot['avg_run_seconds'] = round(self._avg_seconds, 3) if self._avg_seconds is not None else None
+        return snapshot
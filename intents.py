@@ -0,0 +1,87 @@
+import json
+import os
+import re
+
+DEFAULT_INTENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intents.json')
+
+
+def is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+def trie_pattern(keywords):
+    # Builds one regex whose alternatives share common prefixes, so the engine
+    # walks each position once instead of retrying every keyword. Keywords that
+    # start/end with a word character only match on word boundaries.
+    def build(node):
+        alternatives = [re.escape(ch) + build(node[ch]) for ch in sorted(k for k in node if k)]
+        if '' in node:
+            # Ending here is tried last so longer keywords win.
+            alternatives.append(r'(?!\w)' if is_word_char(node[''][-1]) else '')
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+    def trie(words):
+        root = {}
+        for word in words:
+            node = root
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[''] = word
+        return root
+
+    word_start = [k for k in keywords if is_word_char(k[0])]
+    other = [k for k in keywords if not is_word_char(k[0])]
+    # A single lookbehind in front of the word-start trie lets the engine
+    # reject every mid-word position before trying any branch.
+    branches = []
+    if word_start:
+        branches.append(r'(?<!\w)' + build(trie(word_start)))
+    if other:
+        branches.append(build(trie(other)))
+    return '|'.join(branches)
+
+
+class IntentMatcher:
+    def __init__(self, intents, default):
+        self.intents = intents
+        self.default = default
+        self._priority = {}
+        for priority, intent in enumerate(intents):
+            for keyword in intent['keywords']:
+                if keyword:
+                    self._priority.setdefault(keyword.lower(), priority)
+        self._pattern = re.compile(trie_pattern(self._priority)) if self._priority else None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['intents'], config['default'])
+
+    def match(self, message):
+        if self._pattern is None:
+            return None
+        best = None
+        for m in self._pattern.finditer(message.lower()):
+            priority = self._priority[m.group(0)]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return self.intents[best] if best is not None else None
+
+    def respond_with_intent(self, message):
+        # Returns (response, intent); intent is None when the default reply was used.
+        intent = self.match(message)
+        template = intent['response'] if intent else self.default
+        return template.replace('{message}', message), intent
+
+    def respond(self, message):
+        return self.respond_with_intent(message)[0]
+
+
+def load_intent_matchers(path=None):
+    path = path or os.environ.get('INTENTS_FILE', DEFAULT_INTENTS_FILE)
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    return {name: IntentMatcher.from_config(section) for name, section in config.items()}
@@ -0,0 +1,73 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class FileLockLeader:
+    # Leader election between worker processes on one host. Whoever holds an
+    # exclusive POSIX record lock (lockf) on `path` is the leader; the kernel
+    # drops the lock when that process exits (even on a crash), and the next
+    # follower to retry takes over within retry_interval seconds. Unlike
+    # flock, record locks aren't inherited by forked children, so process
+    # pools started by the leader can't keep holding it after the leader dies.
+    # The lock file must not be opened and closed elsewhere in the leader
+    # process, since closing any descriptor for it releases the lock.
+
+    def __init__(self, path, on_elected, retry_interval=5.0):
+        self.path = path
+        self.on_elected = on_elected
+        self.retry_interval = retry_interval
+        self._fd = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            # No flock available: behave as a single-process deployment.
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        self._fd = fd
+        return True
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='leader-election', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.try_acquire():
+                try:
+                    self.on_elected()
+                except Exception as e:
+                    print(f"Error starting leader services: {str(e)}")
+                return
+            self._stop.wait(self.retry_interval)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._fd is not None:
+            if self._fd >= 0:
+                os.close(self._fd)
+            self._fd = None
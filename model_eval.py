@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from upstream import env_int
+
+WORD = re.compile(r'\w+')
+
+
+class EvalModel:
+    # reply(message) returns (response, fallback). Remote models are called
+    # on the shared thread pool; local ones run inline while those calls are
+    # in flight.
+
+    def __init__(self, name, label, reply, remote=False):
+        self.name = name
+        self.label = label
+        self.reply = reply
+        self.remote = remote
+
+
+def parse_eval_prompt(item):
+    # Accepts "text" or {"message"|"prompt": "text", "keywords": [...]}.
+    # Returns (prompt, error).
+    if isinstance(item, str):
+        item = {'message': item}
+    if not isinstance(item, dict):
+        return None, 'Each prompt must be a string or an object'
+    message = item.get('message') or item.get('prompt')
+    if not isinstance(message, str) or not message.strip():
+        return None, 'Prompt message is required'
+    keywords = item.get('keywords') or item.get('expected_keywords') or []
+    if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+        return None, "'keywords' must be a list of strings"
+    return {'message': message, 'keywords': keywords}, None
+
+
+def keyword_coverage(response, keywords):
+    if not keywords:
+        return None
+    text = response.lower()
+    words = set(WORD.findall(text))
+    found = sum(1 for k in keywords if (k.lower() in words if WORD.fullmatch(k) else k.lower() in text))
+    return found / len(keywords)
+
+
+def distribution(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    summary = {
+        'min': round(ordered[0], 3),
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'max': round(ordered[-1], 3)
+    }
+    for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        summary[name] = round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+    return summary
+
+
+eval_pool = None
+eval_pool_lock = threading.Lock()
+
+
+def get_eval_pool():
+    global eval_pool
+    with eval_pool_lock:
+        if eval_pool is None:
+            eval_pool = ThreadPoolExecutor(max_workers=env_int('FINETUNE_TEST_WORKERS', 8),
+                                           thread_name_prefix='finetune-eval')
+        return eval_pool
+
+
+def timed_reply(model, message):
+    start = time.perf_counter()
+    try:
+        response, fallback = model.reply(message)
+        error = None
+    except Exception as e:
+        response, fallback, error = '', True, str(e)
+    return response, fallback, error, (time.perf_counter() - start) * 1000
+
+
+def run_comparison(prompts, models):
+    # Returns (per-prompt results, per-model aggregates).
+    remote = [(i, model, get_eval_pool().submit(timed_reply, model, prompt['message']))
+              for model in models if model.remote
+              for i, prompt in enumerate(prompts)]
+    outcomes = {}
+    for model in models:
+        if not model.remote:
+            for i, prompt in enumerate(prompts):
+                outcomes[i, model.name] = timed_reply(model, prompt['message'])
+    for i, model, future in remote:
+        outcomes[i, model.name] = future.result()
+
+    results = []
+    stats = {model.name: {'lengths': [], 'words': [], 'coverage': [], 'latency': [], 'fallbacks': 0, 'errors': 0}
+             for model in models}
+    for i, prompt in enumerate(prompts):
+        responses = {}
+        for model in models:
+            response, fallback, error, latency_ms = outcomes[i, model.name]
+            coverage = keyword_coverage(response, prompt['keywords'])
+            model_stats = stats[model.name]
+            model_stats['latency'].append(latency_ms)
+            if error is not None:
+                model_stats['errors'] += 1
+                responses[model.name] = {'error': error, 'latency_ms': round(latency_ms, 3)}
+                continue
+            model_stats['lengths'].append(len(response))
+            model_stats['words'].append(len(WORD.findall(response)))
+            if coverage is not None:
+                model_stats['coverage'].append(coverage)
+            if fallback:
+                model_stats['fallbacks'] += 1
+            responses[model.name] = {
+                'response': response,
+                'fallback': fallback,
+                'keyword_coverage': coverage,
+                'latency_ms': round(latency_ms, 3)
+            }
+        results.append({'index': i, 'message': prompt['message'], 'responses': responses})
+
+    summary = {}
+    for model in models:
+        model_stats = stats[model.name]
+        coverage = model_stats['coverage']
+        summary[model.name] = {
+            'model': model.label,
+            'response_chars': distribution(model_stats['lengths']),
+            'response_words': distribution(model_stats['words']),
+            'keyword_coverage': round(sum(coverage) / len(coverage), 4) if coverage else None,
+            'latency_ms': distribution(model_stats['latency']),
+            'fallback_rate': round(model_stats['fallbacks'] / len(prompts), 4) if prompts else 0.0,
+            'errors': model_stats['errors']
+        }
+    return results, summary
@@ -0,0 +1,273 @@
+import calendar
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from scheduler import REMINDER_TIME_FORMAT
+
+DEFAULT_HOUR = 9
+TONIGHT_HOUR = 20
+PARSE_CACHE_SIZE = 4096
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+WEEKDAY_ABBREVIATIONS = {
+    'mon': 0, 'tue': 1, 'tues': 1, 'wed': 2, 'thu': 3, 'thur': 3, 'thurs': 3,
+    'fri': 4, 'sat': 5, 'sun': 6
+}
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+MONTHS['sept'] = 9
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12
+}
+PARTS_OF_DAY = {'morning': 9, 'afternoon': 15, 'evening': 18, 'tonight': TONIGHT_HOUR, 'night': TONIGHT_HOUR}
+
+MONTH_NAMES = '|'.join(sorted(MONTHS, key=len, reverse=True))
+WEEKDAY_NAMES = '|'.join(WEEKDAYS)
+WEEKDAY_ABBREVIATION_NAMES = '|'.join(sorted(WEEKDAY_ABBREVIATIONS, key=len, reverse=True))
+AMOUNT = r'(\d+|' + '|'.join(NUMBER_WORDS) + r')'
+ORDINAL = r'(?:st|nd|rd|th)?'
+
+# Date expressions, tried in order; the first one found wins.
+ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+# The lookarounds reject dates embedded in longer digit/slash runs (3/14/99999),
+# which SLASHED_NUMBERS then reports as invalid rather than leaving in the task.
+NUMERIC_DATE = re.compile(r'(?<![\d/])\b(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?\b(?![/\d])')
+SLASHED_NUMBERS = re.compile(r'\b\d+(?:/\d+)+\b')
+MONTH_DAY = re.compile(r'\b(' + MONTH_NAMES + r')\.?\s+(\d{1,2})' + ORDINAL + r'(?:,?\s+(\d{4}))?\b', re.I)
+DAY_MONTH = re.compile(r'\b(\d{1,2})' + ORDINAL + r'\s+(?:of\s+)?(' + MONTH_NAMES + r')\b\.?(?:,?\s+(\d{4}))?', re.I)
+RELATIVE_OFFSET = re.compile(r'\bin\s+' + AMOUNT + r'\s+(minutes?|mins?|hours?|hrs?|days?|weeks?)\b', re.I)
+DAY_AFTER_TOMORROW = re.compile(r'\b(?:the\s+)?day\s+after\s+tomorrow\b', re.I)
+RELATIVE_DAY = re.compile(r'\b(today|tonight|tomorrow)\b', re.I)
+NEXT_WEEK = re.compile(r'\bnext\s+week\b', re.I)
+WEEKDAY = re.compile(r'\b(?:(next|this|on)\s+)?(' + WEEKDAY_NAMES + r')\b', re.I)
+WEEKDAY_ABBREVIATION = re.compile(r'\b(next|this|on)\s+(' + WEEKDAY_ABBREVIATION_NAMES + r')\b\.?', re.I)
+
+# Time expressions, searched after the date expression has been blanked out.
+CLOCK_MERIDIEM = re.compile(r'\b(?:at\s+)?(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m\b\.?', re.I)
+CLOCK_24H = re.compile(r'\b(?:at\s+)?(\d{1,2}):(\d{2})\b', re.I)
+BARE_HOUR = re.compile(r'\bat\s+(\d{1,2})\b(?!\s*(?:/|-|' + MONTH_NAMES + r'))', re.I)
+NAMED_TIME = re.compile(r'\b(?:at\s+)?(noon|midday|midnight)\b', re.I)
+PART_OF_DAY = re.compile(r'\b(?:in\s+the\s+|this\s+|at\s+)?(morning|afternoon|evening|night)\b', re.I)
+
+WHITESPACE = re.compile(r'\s+')
+LEADING_CONNECTOR = re.compile(r'\b(?:on|at|by|for|due)\s+$', re.I)
+TASK_PREFIX = re.compile(
+    r'^(?:please\s+)?(?:'
+    r'set\s+(?:a\s+)?reminder\s+(?:to|for|about)\s+|'
+    r'remind\s+me\s+(?:to|about|of)\s+|remind\s+me\s+|'
+    r'reminder\s*(?::|to|for|about)?\s+|'
+    r'remember\s+to\s+|'
+    r'remind\s+(?:to\s+)?'
+    r')',
+    re.I
+)
+TASK_SUFFIX = re.compile(r'(?:[\s,;:.!?-]+|\s+(?:on|at|by|in|for|of|this|next|the|reminder))+$', re.I)
+
+
+class ReminderParseError(ValueError):
+    pass
+
+
+def normalise_input(text):
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def amount_value(token):
+    token = token.lower()
+    return int(token) if token.isdigit() else NUMBER_WORDS[token]
+
+
+def match_date(text):
+    # Returns ((kind, values...), span) for the first date expression, or (None, None).
+    m = ISO_DATE.search(text)
+    if m:
+        return ('absolute', int(m.group(1)), int(m.group(2)), int(m.group(3))), m.span()
+    m = NUMERIC_DATE.search(text)
+    if m:
+        year = m.group(3)
+        if year is not None and len(year) == 2:
+            year = '20' + year
+        return ('absolute', int(year) if year else None, int(m.group(1)), int(m.group(2))), m.span()
+    m = SLASHED_NUMBERS.search(text)
+    if m:
+        raise ReminderParseError(f"Invalid date: {m.group(0)}")
+    m = MONTH_DAY.search(text)
+    if m:
+        year = int(m.group(3)) if m.group(3) else None
+        return ('absolute', year, MONTHS[m.group(1).lower()], int(m.group(2))), m.span()
+    m = DAY_MONTH.search(text)
+    if m:
+        year = int(m.group(3)) if m.group(3) else None
+        return ('absolute', year, MONTHS[m.group(2).lower()], int(m.group(1))), m.span()
+    m = RELATIVE_OFFSET.search(text)
+    if m:
+        amount = amount_value(m.group(1))
+        unit = m.group(2).lower()
+        if unit.startswith('min'):
+            return ('offset', amount * 60), m.span()
+        if unit.startswith('h'):
+            return ('offset', amount * 3600), m.span()
+        if unit.startswith('day'):
+            return ('days', amount), m.span()
+        return ('days', amount * 7), m.span()
+    m = DAY_AFTER_TOMORROW.search(text)
+    if m:
+        return ('days', 2), m.span()
+    m = RELATIVE_DAY.search(text)
+    if m:
+        word = m.group(1).lower()
+        if word == 'tonight':
+            return ('tonight',), m.span()
+        return ('days', 1 if word == 'tomorrow' else 0), m.span()
+    m = NEXT_WEEK.search(text)
+    if m:
+        return ('days', 7), m.span()
+    m = WEEKDAY.search(text)
+    if m:
+        return ('weekday', WEEKDAYS.index(m.group(2).lower()), (m.group(1) or '').lower()), m.span()
+    m = WEEKDAY_ABBREVIATION.search(text)
+    if m:
+        return ('weekday', WEEKDAY_ABBREVIATIONS[m.group(2).lower()], m.group(1).lower()), m.span()
+    return None, None
+
+
+def match_time(text):
+    # Returns ((hour, minute), span) or (None, None).
+    m = CLOCK_MERIDIEM.search(text)
+    if m:
+        hour = int(m.group(1))
+        minute = int(m.group(2) or 0)
+        if not 1 <= hour <= 12:
+            raise ReminderParseError(f"Invalid time: {m.group(0).strip()}")
+        if m.group(3).lower() == 'p' and hour < 12:
+            hour += 12
+        elif m.group(3).lower() == 'a' and hour == 12:
+            hour = 0
+        return (hour, minute), m.span()
+    m = CLOCK_24H.search(text)
+    if m:
+        return (int(m.group(1)), int(m.group(2))), m.span()
+    m = NAMED_TIME.search(text)
+    if m:
+        return ((0, 0) if m.group(1).lower() == 'midnight' else (12, 0)), m.span()
+    m = BARE_HOUR.search(text)
+    if m:
+        hour = int(m.group(1))
+        # "at 3" almost always means the afternoon; early-morning reminders
+        # need an explicit "am" or 24h time.
+        if 1 <= hour <= 7:
+            hour += 12
+        return (hour, 0), m.span()
+    m = PART_OF_DAY.search(text)
+    if m:
+        return (PARTS_OF_DAY[m.group(1).lower()], 0), m.span()
+    return None, None
+
+
+def blank(text, span):
+    # Blanks out a matched span plus a dangling connector ("on", "at", ...)
+    # right before it, keeping every other index stable.
+    start, end = span
+    connector = LEADING_CONNECTOR.search(text[:start])
+    if connector:
+        start = connector.start()
+    return text[:start] + ' ' * (end - start) + text[end:]
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_reminder_spec(text):
+    # Everything that doesn't depend on the current time, cached per
+    # normalised input: (task, date_spec, time_spec).
+    date_spec, date_span = match_date(text)
+    remaining = blank(text, date_span) if date_span else text
+    time_spec, time_span = match_time(remaining)
+    if time_span:
+        remaining = blank(remaining, time_span)
+    if time_spec and not (0 <= time_spec[0] <= 23 and 0 <= time_spec[1] <= 59):
+        raise ReminderParseError("Invalid time")
+
+    task = normalise_input(remaining)
+    anchored = TASK_PREFIX.match(task) is not None
+    task = TASK_PREFIX.sub('', task)
+    task = TASK_SUFFIX.sub('', task).strip()
+    if not task:
+        raise ReminderParseError("Could not extract task")
+    # Without a date, a time or a "remind me ..." there is nothing to say the
+    # text is a reminder at all, rather than a stray line in a bulk import.
+    if not (anchored or date_spec or time_spec):
+        raise ReminderParseError("Could not find a date or time")
+    return task, date_spec, time_spec
+
+
+def resolve_datetime(date_spec, time_spec, now):
+    # Huge relative amounts ("in 99999999999 days") overflow date arithmetic.
+    try:
+        target = resolve_datetime_unchecked(date_spec, time_spec, now)
+    except ReminderParseError:
+        raise
+    except (OverflowError, ValueError):
+        raise ReminderParseError("Date is out of range")
+    # Dates without a year roll forward, but an explicit one that has passed
+    # ("January 1 2020", "today at 8am" in the afternoon) would fire at once.
+    if target < now.replace(second=0, microsecond=0):
+        raise ReminderParseError("Date is in the past")
+    return target
+
+
+def resolve_datetime_unchecked(date_spec, time_spec, now):
+    today = now.date()
+    if date_spec is None:
+        if time_spec is None:
+            return (now + timedelta(hours=1)).replace(second=0, microsecond=0)
+        target = datetime.combine(today, datetime.min.time()).replace(hour=time_spec[0], minute=time_spec[1])
+        return target if target > now else target + timedelta(days=1)
+
+    kind = date_spec[0]
+    if kind == 'offset':
+        target = (now + timedelta(seconds=date_spec[1])).replace(second=0, microsecond=0)
+        if time_spec is None:
+            return target
+        return target.replace(hour=time_spec[0], minute=time_spec[1])
+
+    hour, minute = time_spec if time_spec else (DEFAULT_HOUR, 0)
+    if kind == 'absolute':
+        _, year, month, day = date_spec
+        try:
+            target_date = date(year or today.year, month, day)
+            if year is None and target_date < today:
+                target_date = date(today.year + 1, month, day)
+        except ValueError:
+            raise ReminderParseError(f"Invalid date: {month}/{day}")
+    elif kind == 'days':
+        target_date = today + timedelta(days=date_spec[1])
+    elif kind == 'tonight':
+        target_date = today
+        if not time_spec:
+            hour, minute = TONIGHT_HOUR, 0
+        elif hour < 12:
+            hour += 12
+    else:
+        _, weekday, mode = date_spec
+        days_ahead = (weekday - today.weekday()) % 7
+        if mode == 'next' and days_ahead == 0:
+            days_ahead = 7
+        target_date = today + timedelta(days=days_ahead)
+        if days_ahead == 0 and datetime.combine(target_date, datetime.min.time()).replace(hour=hour, minute=minute) <= now:
+            target_date += timedelta(days=7)
+    return datetime.combine(target_date, datetime.min.time()).replace(hour=hour, minute=minute)
+
+
+def parse_reminder(user_input, now=None):
+    now = now or datetime.now()
+    try:
+        task, date_spec, time_spec = parse_reminder_spec(normalise_input(user_input))
+        target = resolve_datetime(date_spec, time_spec, now)
+    except ReminderParseError as e:
+        return {"parsed": False, "error": str(e)}
+    return {
+        "parsed": True,
+        "task": task,
+        "datetime": target.strftime(REMINDER_TIME_FORMAT)
+    }
@@ -0,0 +1,315 @@
+import os
+import sqlite3
+import threading
+
+from scheduler import parse_due_time
+
+REMINDER_FIELDS = ('id', 'task', 'datetime', 'email', 'created_at', 'sent', 'failed', 'error')
+# 'pending' reminders are still to be sent; 'failed' ones were dead-lettered
+# after every delivery attempt failed and are never scheduled again.
+REMINDER_STATUSES = ('pending', 'failed')
+
+
+class MemoryReminderStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._next_id = 1
+        self._version = 0
+
+    def add(self, reminder):
+        return self.add_many([reminder])[0]
+
+    def add_many(self, reminders):
+        saved = []
+        with self._lock:
+            for reminder in reminders:
+                row = dict(reminder, id=self._next_id, sent=False, failed=False, error=None)
+                self._next_id += 1
+                self._rows[row['id']] = row
+                saved.append(dict(row))
+            self._version += 1
+        return saved
+
+    def get(self, reminder_id):
+        with self._lock:
+            row = self._rows.get(reminder_id)
+            return dict(row) if row else None
+
+    def mark_sent(self, reminder_ids):
+        with self._lock:
+            for reminder_id in reminder_ids:
+                if reminder_id in self._rows:
+                    self._rows[reminder_id]['sent'] = True
+            self._version += 1
+
+    def mark_failed(self, reminder_id, error):
+        with self._lock:
+            if reminder_id in self._rows:
+                self._rows[reminder_id].update(failed=True, error=error)
+            self._version += 1
+
+    def pending(self):
+        return self._with_status('pending')
+
+    def _with_status(self, status):
+        failed = status == 'failed'
+        with self._lock:
+            rows = [dict(r) for r in self._rows.values() if not r['sent'] and r['failed'] == failed]
+        rows.sort(key=lambda r: (r['datetime'], r['id']))
+        return rows
+
+    def last_id(self):
+        with self._lock:
+            return self._next_id - 1
+
+    def added_since(self, last_id, limit=1000):
+        with self._lock:
+            rows = [dict(self._rows[i]) for i in range(last_id + 1, min(self._next_id, last_id + 1 + limit))
+                    if i in self._rows]
+        return rows
+
+    def query(self, email=None, due_from=None, due_to=None, after=None, limit=100, status='pending'):
+        rows = []
+        for row in self._with_status(status):
+            due_ts = parse_due_time(row['datetime'])
+            if email is not None and row['email'] != email:
+                continue
+            if due_from is not None and due_ts < due_from:
+                continue
+            if due_to is not None and due_ts > due_to:
+                continue
+            if after is not None and (due_ts, row['id']) <= tuple(after):
+                continue
+            rows.append(row)
+            if len(rows) > limit:
+                break
+        return _page(rows, limit)
+
+    def version(self):
+        with self._lock:
+            return self._version
+
+    def close(self):
+        pass
+
+
+class SQLiteReminderStore:
+    # One connection per thread; WAL lets request threads read while the
+    # scheduler thread writes. Writes are serialised by a single lock.
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT NOT NULL,
+            datetime TEXT NOT NULL,
+            due_ts REAL NOT NULL,
+            email TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_reminders_sent_due ON reminders (sent, due_ts, id);
+        CREATE INDEX IF NOT EXISTS idx_reminders_email ON reminders (email, sent, due_ts);
+        CREATE TABLE IF NOT EXISTS reminders_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO reminders_meta (key, value) VALUES ('version', 0);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        self._migrate(conn)
+        conn.commit()
+
+    @staticmethod
+    def _migrate(conn):
+        # Databases created before dead-lettered reminders were recorded.
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(reminders)')}
+        if 'failed' not in columns:
+            conn.execute('ALTER TABLE reminders ADD COLUMN failed INTEGER NOT NULL DEFAULT 0')
+        if 'error' not in columns:
+            conn.execute('ALTER TABLE reminders ADD COLUMN error TEXT')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        reminder = {field: row[field] for field in REMINDER_FIELDS}
+        reminder['sent'] = bool(reminder['sent'])
+        reminder['failed'] = bool(reminder['failed'])
+        return reminder
+
+    def add(self, reminder):
+        return self.add_many([reminder])[0]
+
+    def add_many(self, reminders):
+        conn = self._conn()
+        saved = []
+        with self._write_lock, conn:
+            for reminder in reminders:
+                cursor = conn.execute(
+                    'INSERT INTO reminders (task, datetime, due_ts, email, created_at, sent) VALUES (?, ?, ?, ?, ?, 0)',
+                    (reminder['task'], reminder['datetime'], parse_due_time(reminder['datetime']),
+                     reminder['email'], reminder['created_at'])
+                )
+                saved.append(dict(reminder, id=cursor.lastrowid, sent=False, failed=False, error=None))
+            self._bump_version(conn)
+        return saved
+
+    def get(self, reminder_id):
+        row = self._conn().execute('SELECT * FROM reminders WHERE id = ?', (reminder_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def mark_sent(self, reminder_ids):
+        reminder_ids = list(reminder_ids)
+        if not reminder_ids:
+            return
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.executemany('UPDATE reminders SET sent = 1 WHERE id = ?', [(i,) for i in reminder_ids])
+            self._bump_version(conn)
+
+    def mark_failed(self, reminder_id, error):
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.execute('UPDATE reminders SET failed = 1, error = ? WHERE id = ?', (error, reminder_id))
+            self._bump_version(conn)
+
+    @staticmethod
+    def _bump_version(conn):
+        conn.execute("UPDATE reminders_meta SET value = value + 1 WHERE key = 'version'")
+
+    def pending(self):
+        rows = self._conn().execute('SELECT * FROM reminders WHERE sent = 0 AND failed = 0 ORDER BY due_ts, id').fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def last_id(self):
+        return self._conn().execute('SELECT COALESCE(MAX(id), 0) FROM reminders').fetchone()[0]
+
+    def added_since(self, last_id, limit=1000):
+        # Writers are serialised, so ids become visible in increasing order
+        # and an id cursor never skips a row committed by another process.
+        rows = self._conn().execute(
+            'SELECT * FROM reminders WHERE id > ? ORDER BY id LIMIT ?', (last_id, limit)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def query(self, email=None, due_from=None, due_to=None, after=None, limit=100, status='pending'):
+        sql = 'SELECT * FROM reminders WHERE sent = 0 AND failed = ?'
+        params = [1 if status == 'failed' else 0]
+        if email is not None:
+            sql += ' AND email = ?'
+            params.append(email)
+        if due_from is not None:
+            sql += ' AND due_ts >= ?'
+            params.append(due_from)
+        if due_to is not None:
+            sql += ' AND due_ts <= ?'
+            params.append(due_to)
+        if after is not None:
+            sql += ' AND (due_ts, id) > (?, ?)'
+            params.extend(after)
+        sql += ' ORDER BY due_ts, id LIMIT ?'
+        params.append(limit + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        return _page([self._to_dict(row) for row in rows], limit)
+
+    def version(self):
+        row = self._conn().execute("SELECT value FROM reminders_meta WHERE key = 'version'").fetchone()
+        return row[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class ReminderSync:
+    # Keeps a scheduler in step with a store that other processes also write
+    # to: load() schedules what is pending, then a poller picks up every
+    # reminder added after that through an id cursor.
+
+    def __init__(self, store, scheduler, interval=1.0, batch_size=1000):
+        self.store = store
+        self.scheduler = scheduler
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_id = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _schedule(self, reminders):
+        self.scheduler.schedule_many((parse_due_time(r['datetime']), r) for r in reminders
+                                     if not r['sent'] and not r['failed'])
+
+    def load(self):
+        # Read the cursor first: anything added after it is left to poll(),
+        # so nothing is missed or scheduled twice.
+        self.last_id = self.store.last_id()
+        pending = [r for r in self.store.pending() if r['id'] <= self.last_id]
+        self._schedule(pending)
+        return len(pending)
+
+    def poll(self):
+        added = 0
+        while True:
+            rows = self.store.added_since(self.last_id, self.batch_size)
+            if not rows:
+                return added
+            self._schedule(rows)
+            self.last_id = rows[-1]['id']
+            added += len(rows)
+            if len(rows) < self.batch_size:
+                return added
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='reminder-sync', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error syncing reminders: {str(e)}")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def _page(rows, limit):
+    # Callers fetch limit + 1 rows; the extra one only signals another page.
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, (parse_due_time(last['datetime']), last['id'])
+    return rows, None
+
+
+def create_reminder_store(backend=None, path=None):
+    backend = backend or os.environ.get('REMINDER_STORE', 'sqlite')
+    if backend == 'memory':
+        return MemoryReminderStore()
+    if backend == 'sqlite':
+        return SQLiteReminderStore(path or os.environ.get('REMINDER_DB', 'reminders.db'))
+    raise ValueError(f"Unknown reminder store backend: {backend}")
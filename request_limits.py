@@ -0,0 +1,184 @@
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class RateLimit:
+    # A token bucket: up to `burst` requests at once, refilled at
+    # count/period tokens per second.
+
+    def __init__(self, count, period, burst=None):
+        self.count = count
+        self.period = period
+        self.rate = count / period
+        self.burst = burst if burst is not None else count
+
+    @classmethod
+    def parse(cls, spec):
+        # "30/minute" or "30/minute:10" (burst of 10); "off" disables.
+        if spec is None or spec == 'off':
+            return None
+        rate, _, burst = spec.partition(':')
+        count, _, period = rate.partition('/')
+        if period not in PERIODS:
+            raise ValueError(f"Unknown rate limit period in {spec!r}")
+        return cls(int(count), PERIODS[period], int(burst) if burst else None)
+
+    def __str__(self):
+        return f"{self.count}/{self.period}s"
+
+
+def parse_route_settings(raw, parse):
+    # RATE_LIMITS / MAX_CONTENT_LENGTHS style env values: a JSON object
+    # mapping URL rules to settings.
+    if not raw:
+        return {}
+    return {route: parse(value) for route, value in json.loads(raw).items()}
+
+
+def refill(tokens, updated_at, now, limit):
+    return min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+
+def take_token(tokens, updated_at, now, limit):
+    # Returns (allowed, tokens left, seconds until the next token).
+    tokens = refill(tokens, updated_at, now, limit)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / limit.rate
+
+
+class MemoryBucketStore:
+    # Buckets for this process only. Least recently used buckets beyond
+    # max_keys are dropped; a dropped bucket comes back full, which for an
+    # idle client is what it would have refilled to anyway.
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, limit):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (limit.burst, now))
+            allowed, tokens, retry_after = take_token(tokens, updated_at, now, limit)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens, retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    # Buckets shared by every process using the same file, so a gunicorn or
+    # uvicorn worker pool enforces one limit per client rather than one per
+    # worker. Each take is a short IMMEDIATE transaction.
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    """
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, limit):
+        # Wall-clock time, since the timestamps are compared across processes.
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated_at = row if row is not None else (limit.burst, now)
+            allowed, tokens, retry_after = take_token(tokens, updated_at, now, limit)
+            conn.execute('INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                # A bucket untouched for a day has long since refilled.
+                conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - 86400,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens, retry_after
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM rate_limit_buckets').fetchone()[0]
+
+
+def create_bucket_store(backend, path=None):
+    if backend == 'memory':
+        return MemoryBucketStore()
+    if backend == 'sqlite':
+        return SQLiteBucketStore(path)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+class RateLimiter:
+    # One bucket per (client, route). `limits` maps URL rules to a RateLimit,
+    # or None to exempt the route; other routes get `default`.
+
+    def __init__(self, store, limits, default=None):
+        self.store = store
+        self.limits = limits
+        self.default = default
+        self._lock = threading.Lock()
+        self.counters = {'allowed': 0, 'limited': 0}
+
+    def limit_for(self, route):
+        return self.limits.get(route, self.default)
+
+    def hit(self, client, route):
+        # Returns (allowed, limit, retry_after_seconds).
+        limit = self.limit_for(route)
+        if limit is None:
+            return True, None, 0
+        allowed, _, retry_after = self.store.take(f"{client}|{route}", limit)
+        with self._lock:
+            self.counters['allowed' if allowed else 'limited'] += 1
+        return allowed, limit, math.ceil(retry_after)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+        snapshot['buckets'] = len(self.store)
+        return snapshot
+
+
+class BodySizeLimits:
+    # Maximum request body in bytes per URL rule; None means unlimited.
+
+    def __init__(self, limits, default):
+        self.limits = limits
+        self.default = default
+
+    def limit_for(self, route):
+        return self.limits.get(route, self.default)
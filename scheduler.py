@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+REMINDER_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+@lru_cache(maxsize=65536)
+def parse_due_time(value):
+    return datetime.strptime(value, REMINDER_TIME_FORMAT).timestamp()
+
+
+class ReminderScheduler:
+    # Min-heap of (due_ts, seq, item). The worker sleeps on a condition until
+    # the earliest due time and is woken early whenever a sooner item arrives,
+    # so each fire costs one heappop instead of a scan over every reminder.
+
+    def __init__(self, on_due, clock=time.time):
+        self._on_due = on_due
+        self._clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.fired = 0
+        self.last_lag = 0.0
+
+    def schedule(self, due_ts, item):
+        with self._cond:
+            heapq.heappush(self._heap, (due_ts, next(self._seq), item))
+            if self._heap[0][2] is item:
+                self._cond.notify()
+
+    def schedule_many(self, entries):
+        entries = [(due_ts, next(self._seq), item) for due_ts, item in entries]
+        with self._cond:
+            # Small batches into a big heap are cheaper pushed one by one;
+            # large ones (e.g. startup recovery) are cheaper to re-heapify.
+            if len(entries) * 8 < len(self._heap):
+                for entry in entries:
+                    heapq.heappush(self._heap, entry)
+            else:
+                self._heap.extend(entries)
+                heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def next_due(self):
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        # 'dead' means start() was called but the worker thread has exited.
+        with self._cond:
+            running = self._running
+        if not running:
+            return 'stopped'
+        return 'running' if self.is_alive() else 'dead'
+
+    def _take_due(self):
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - self._clock()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                now = self._clock()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due_ts, _, item = heapq.heappop(self._heap)
+                    due.append(item)
+                    self.last_lag = now - due_ts
+                return due
+            return None
+
+    def _run(self):
+        while True:
+            due = self._take_due()
+            if due is None:
+                return
+            # Callbacks run outside the heap lock so slow deliveries never
+            # block schedule() calls from request threads.
+            for item in due:
+                try:
+                    self._on_due(item)
+                except Exception as e:
+                    print(f"Error in reminder scheduler: {str(e)}")
+                self.fired += 1
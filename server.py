@@ -1,10 +1,11 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
 import requests
 import base64
+import io
 from io import BytesIO
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 import threading
 import time
@@ -12,14 +13,391 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import re
+import hashlib
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from scheduler import ReminderScheduler, parse_due_time
+from reminder_store import REMINDER_FIELDS, REMINDER_STATUSES, MemoryReminderStore, ReminderSync, create_reminder_store
+from upstream import CircuitBreakers, UpstreamBusy, UpstreamClient, UpstreamStatusError, is_upstream_failure
+from image_cache import ImageCache, prompt_key
+from image_jobs import DONE, FINISHED, QUEUED, ImageJobQueue, QueueFull
+from chat_cache import ChatResponseCache, chat_cache_key
+from intents import load_intent_matchers
+from reminder_parser import parse_reminder
+from email_delivery import EmailDeliveryService
+from finetune_data import DatasetValidator, iter_uploaded_examples
+from dataset_analysis import AnalysisCache, analyse_examples, spool_stream
+from model_eval import EvalModel, parse_eval_prompt, run_comparison
+from telemetry import PROMETHEUS_CONTENT_TYPE, Registry, RequestMetricsMiddleware, SamplingProfiler
+from leader import FileLockLeader
+from request_limits import BodySizeLimits, RateLimit, RateLimiter, create_bucket_store, parse_route_settings
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.wsgi import LimitedStream
+
+class RouteLimitedRequest(Request):
+    # Werkzeug enforces max_content_length as the body is read, which also
+    # stops chunked uploads that send no Content-Length: reading past the cap
+    # raises RequestEntityTooLarge, answered with a JSON 413 below.
+    @property
+    def max_content_length(self):
+        return request_size_limits.limit_for(self.url_rule.rule if self.url_rule is not None else 'unmatched')
+    
+    def get_data(self, *args, **kwargs):
+        # get_data() (and so get_json()) stops quietly at the cap instead of
+        # raising, which would hand a truncated body to the JSON parser. One
+        # more read past the cap raises.
+        data = super().get_data(*args, **kwargs)
+        if self.content_length is None and isinstance(self.stream, LimitedStream) and self.stream.is_exhausted:
+            self.stream.read(1)
+        return data
 
 app = Flask(__name__)
+app.request_class = RouteLimitedRequest
 CORS(app)
 
+metrics_registry = Registry()
+request_latency = metrics_registry.histogram(
+    'zbot_http_request_duration_seconds', 'Request latency by route, measured until the body is fully sent',
+    ('method', 'route', 'status')
+)
+request_metrics = RequestMetricsMiddleware(app.wsgi_app, request_latency)
+app.wsgi_app = request_metrics
+
+# Behind N reverse proxies, take the client address from X-Forwarded-For.
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+@app.before_request
+def tag_request_route():
+    if request.url_rule is not None:
+        request.environ[RequestMetricsMiddleware.ROUTE_ENVIRON_KEY] = request.url_rule.rule
+
+# Per client and route token buckets, and per route body size limits.
+# Both are checked before the body is read, so a flood or an oversized
+# upload is turned away without being parsed. Override per route with JSON
+# in RATE_LIMITS / MAX_CONTENT_LENGTHS, e.g. RATE_LIMITS='{"/api/chat": "60/minute:20"}'.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+RATE_LIMITS = {
+    '/api/chat': '30/minute:10',
+    '/api/generate-image': '10/minute:5',
+    '/api/images/jobs': '20/minute:10',
+    '/api/create-reminder': '30/minute:10',
+    '/api/reminders/bulk': '5/minute:2',
+    '/api/finetune/prepare': '10/minute:5',
+    '/api/finetune/analyze': '10/minute:5',
+    '/api/finetune/test': '30/minute:10',
+    '/health': 'off',
+    '/metrics': 'off'
+}
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 1 << 20))
+MAX_CONTENT_LENGTHS = {
+    # Base64 image attachments.
+    '/api/chat': 8 << 20,
+    '/api/reminders/bulk': 16 << 20,
+    # Fine-tuning uploads are streamed, not held in memory.
+    '/api/finetune/prepare': 512 << 20,
+    '/api/finetune/analyze': 512 << 20,
+    '/api/finetune/test': 64 << 20
+}
+
+rate_limiter = RateLimiter(
+    create_bucket_store(os.environ.get('RATE_LIMIT_BACKEND', 'memory'), os.environ.get('RATE_LIMIT_DB', 'ratelimit.db')),
+    dict({route: RateLimit.parse(spec) for route, spec in RATE_LIMITS.items()},
+         **parse_route_settings(os.environ.get('RATE_LIMITS'), RateLimit.parse)),
+    default=RateLimit.parse(os.environ.get('RATE_LIMIT_DEFAULT', '300/minute:100'))
+)
+request_size_limits = BodySizeLimits(
+    dict(MAX_CONTENT_LENGTHS, **parse_route_settings(os.environ.get('MAX_CONTENT_LENGTHS'), int)),
+    MAX_CONTENT_LENGTH
+)
+
+def route_for(path, method):
+    # The URL rule a path matches, for callers outside Flask's dispatch (asgi.py).
+    try:
+        rule, _ = app.url_map.bind('localhost').match(path, method=method, return_rule=True)
+        return rule.rule
+    except HTTPException:
+        return 'unmatched'
+
+def request_limit_rejection(client, route, method, content_length):
+    # Returns (payload, status, headers) when the request should be turned
+    # away, else None.
+    max_length = request_size_limits.limit_for(route)
+    if content_length is not None and max_length is not None and content_length > max_length:
+        return {'success': False, 'error': f'Request body too large (limit {max_length} bytes)'}, 413, {}
+    if not RATE_LIMIT_ENABLED or method == 'OPTIONS':
+        return None
+    allowed, limit, retry_after = rate_limiter.hit(client, route)
+    if allowed:
+        return None
+    return (
+        {'success': False, 'error': 'Too many requests, please slow down'},
+        429,
+        {'Retry-After': str(max(1, retry_after)), 'X-RateLimit-Limit': str(limit)}
+    )
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    # Chunked bodies only hit the cap once the route reads them.
+    max_length = request.max_content_length
+    return jsonify({'success': False, 'error': f'Request body too large (limit {max_length} bytes)'}), 413
+
+@app.before_request
+def enforce_request_limits():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    rejection = request_limit_rejection(request.remote_addr, route, request.method, request.content_length)
+    if rejection is not None:
+        payload, status, headers = rejection
+        return jsonify(payload), status, headers
+
 HF_API_URL = "https://api-inference.huggingface.co/models/"
+POLLINATIONS_URL = "https://image.pollinations.ai/prompt/"
+
+hf_client = UpstreamClient('huggingface', HF_API_URL, read_timeout=10)
+pollinations_client = UpstreamClient('pollinations', POLLINATIONS_URL, read_timeout=30)
+upstream_clients = [hf_client, pollinations_client]
+# Per-model circuits for chat; shared with the async client in asgi.py.
+hf_breakers = CircuitBreakers('huggingface')
+
+upstream_latency = metrics_registry.histogram(
+    'zbot_upstream_request_duration_seconds', 'Upstream request latency including failed attempts',
+    ('upstream', 'outcome')
+)
+for client in upstream_clients:
+    client.metrics.add_observer(
+        lambda elapsed_ms, ok, name=client.name: upstream_latency.observe(elapsed_ms / 1000, name, 'ok' if ok else 'error')
+    )
+chat_fallbacks = metrics_registry.counter(
+    'zbot_chat_fallbacks_total', 'Chat replies answered by generate_simple_response instead of the model', ('reason',)
+)
+
+reminder_store = create_reminder_store()
+image_cache = ImageCache()
+chat_cache = ChatResponseCache()
+intent_matchers = load_intent_matchers()
+analysis_cache = AnalysisCache()
+
+HF_CHAT_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+
+def image_chat_response(message):
+    response_text = f"I can see you've attached an image. For free image analysis, I recommend using these services:\n\n"
+    response_text += "1. Upload to imgur.com and use their description\n"
+    response_text += "2. Use Google Lens (lens.google.com)\n"
+    response_text += "3. Try Hugging Face's BLIP model for image captioning\n\n"
+    response_text += f"Your question was: {message}\n\n"
+    response_text += "Note: Full vision AI requires API keys. This is a demo mode."
+    return response_text
+
+HF_CHAT_PARAMETERS = {"max_new_tokens": 200}
+
+def hf_chat_payload(message):
+    return {"inputs": message, "parameters": HF_CHAT_PARAMETERS}
+
+def hf_chat_cache_key(message):
+    return chat_cache_key(message, HF_CHAT_MODEL, HF_CHAT_PARAMETERS)
+
+def chat_cache_bypassed(headers):
+    # Either `X-Cache-Bypass: 1` or a standard `Cache-Control: no-cache` skips the lookup.
+    if headers.get('X-Cache-Bypass', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'no-cache' in headers.get('Cache-Control', '').lower()
+
+def chat_fallback_response(message, reason):
+    chat_fallbacks.inc(reason)
+    return generate_simple_response(message)
+
+def hf_chat_reply(message, status_code, result):
+    if status_code != 200:
+        return chat_fallback_response(message, 'upstream_status')
+    if isinstance(result, list) and len(result) > 0 and isinstance(result[0], dict):
+        response_text = result[0].get('generated_text', message)
+        if message in response_text:
+            response_text = response_text.replace(message, '').strip()
+        return response_text
+    return "I'm an AI assistant. How can I help you today?"
+
+def record_hf_outcome(breaker, started, status_code=200, error=None, finished=None):
+    # Errors that carry a status (UpstreamStatusError) only count against
+    # the circuit when the status points at the upstream, not our request.
+    if error is not None:
+        status_code = getattr(error, 'status_code', None)
+    elapsed_ms = ((finished or time.perf_counter()) - started) * 1000
+    breaker.record(elapsed_ms, status_code is not None and not is_upstream_failure(status_code))
+
+def hf_chat_outcome(message, breaker, started, status_code=None, result=None, error=None):
+    # Turns one chat call into (reply, ok) and records it on the breaker.
+    # Shared by fetch_hf_chat_reply and its async twin in asgi.py, which
+    # differ only in how they call the upstream.
+    if isinstance(error, UpstreamBusy):
+        # Our own concurrency limit, not the upstream failing.
+        return chat_fallback_response(message, 'upstream_busy'), False
+    if error is not None:
+        record_hf_outcome(breaker, started, error=error)
+        print(f"Error calling {HF_CHAT_MODEL}: {str(error)}")
+        return chat_fallback_response(message, 'upstream_error'), False
+    record_hf_outcome(breaker, started, status_code)
+    return hf_chat_reply(message, status_code, result), status_code == 200
+
+def fetch_hf_chat_reply(message):
+    # Returns (reply, ok); fallback replies come back with ok=False. While
+    # the model's circuit is open the fallback is served without calling out.
+    breaker = hf_breakers.get(HF_CHAT_MODEL)
+    if not breaker.allow():
+        return chat_fallback_response(message, 'circuit_open'), False
+    start = time.perf_counter()
+    try:
+        hf_response = hf_client.post(HF_CHAT_MODEL, json=hf_chat_payload(message))
+        result = hf_response.json() if hf_response.status_code == 200 else None
+    except (requests.RequestException, UpstreamBusy, ValueError) as e:
+        return hf_chat_outcome(message, breaker, start, error=e)
+    return hf_chat_outcome(message, breaker, start, hf_response.status_code, result)
+
+STREAM_CHUNK_WORDS = 3
+
+def sse_event(data, event=None):
+    lines = f"event: {event}\n" if event else ""
+    return lines + f"data: {json.dumps(data)}\n\n"
+
+def chat_stream_requested(data, headers):
+    return bool(data.get('stream')) or 'text/event-stream' in headers.get('Accept', '')
+
+def text_chunks(text, words=STREAM_CHUNK_WORDS):
+    # Split on spaces but keep them attached so the chunks concatenate back
+    # to the original text, newlines included.
+    parts = re.split(r'( +)', text)
+    chunk = ''
+    count = 0
+    for part in parts:
+        chunk += part
+        if part.strip():
+            count += 1
+            if count == words:
+                yield chunk
+                chunk = ''
+                count = 0
+    if chunk:
+        yield chunk
+
+def hf_stream_token(line):
+    # Hugging Face streams `data: {"token": {"text": ..., "special": ...}, ...}` lines.
+    if not line or not line.startswith('data:'):
+        return None
+    payload = json.loads(line[5:])
+    token = payload.get('token') or {}
+    if token.get('special'):
+        return None
+    return token.get('text')
 
-reminders = []
-reminders_lock = threading.Lock()
+def hf_stream_tokens(message):
+    hf_response = hf_client.post(
+        HF_CHAT_MODEL, json=dict(hf_chat_payload(message), stream=True), stream=True
+    )
+    try:
+        if hf_response.status_code != 200:
+            raise UpstreamStatusError(hf_client.name, hf_response.status_code)
+        for line in hf_response.iter_lines(decode_unicode=True):
+            text = hf_stream_token(line)
+            if text:
+                yield text
+    finally:
+        # Closing drops the upstream connection, which is how a client
+        # disconnect cancels generation.
+        hf_response.close()
+
+def canned_chat_events(response_text, source):
+    # A reply that is already complete, streamed in word chunks.
+    for chunk in text_chunks(response_text):
+        yield sse_event({'token': chunk})
+    yield sse_event({'response': response_text, 'source': source}, 'done')
+
+class ChatStream:
+    # Cache, breaker and fallback bookkeeping for one streamed chat reply.
+    # stream_chat_events here and its async twin in asgi.py only differ in
+    # how they read tokens from the upstream; both drive one of these:
+    #
+    #   if stream.cached is not None: replay it
+    #   if stream.begin(): feed token() for each upstream token, then
+    #       complete() or fail(error), then end()
+    #   finish() yields the closing events
+    
+    def __init__(self, message, bypass=False):
+        self.message = message
+        self.key = hf_chat_cache_key(message)
+        self.cached = None if bypass else chat_cache.get(self.key)
+        self.breaker = hf_breakers.get(HF_CHAT_MODEL)
+        self.tokens = []
+        self.completed = False
+        self.error = None
+        self.fallback_reason = 'circuit_open'
+        self.started = time.perf_counter()
+        self.first_token_at = None
+    
+    def begin(self):
+        # False while the model's circuit is open.
+        if not self.breaker.allow():
+            return False
+        self.fallback_reason = 'stream_error'
+        return True
+    
+    def token(self, text):
+        self.first_token_at = self.first_token_at or time.perf_counter()
+        self.tokens.append(text)
+        return sse_event({'token': text})
+    
+    def complete(self):
+        self.completed = True
+    
+    def fail(self, error):
+        print(f"Error streaming chat: {str(error)}")
+        if isinstance(error, UpstreamBusy):
+            # Our own concurrency limit, not the upstream failing.
+            self.fallback_reason = 'upstream_busy'
+        else:
+            self.error = error
+    
+    def end(self):
+        # Streams are judged by time to first token.
+        if self.fallback_reason != 'upstream_busy':
+            record_hf_outcome(self.breaker, self.started, error=None if self.tokens else self.error,
+                              finished=self.first_token_at)
+    
+    def finish(self):
+        if self.tokens:
+            response_text = ''.join(self.tokens).strip()
+            if self.completed:
+                chat_cache.put(self.key, response_text, (time.perf_counter() - self.started) * 1000)
+            yield sse_event({'response': response_text, 'source': 'model'}, 'done')
+            return
+        yield from canned_chat_events(chat_fallback_response(self.message, self.fallback_reason), 'fallback')
+
+def stream_chat_events(message, image=None, bypass=False):
+    if image:
+        yield from canned_chat_events(image_chat_response(message), 'vision-demo')
+        return
+    
+    stream = ChatStream(message, bypass)
+    if stream.cached is not None:
+        yield from canned_chat_events(stream.cached, 'cache')
+        return
+    
+    if stream.begin():
+        try:
+            with closing(hf_stream_tokens(message)) as upstream_tokens:
+                for text in upstream_tokens:
+                    yield stream.token(text)
+            stream.complete()
+        except Exception as e:
+            stream.fail(e)
+        stream.end()
+    yield from stream.finish()
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -34,38 +412,24 @@ def chat():
                 'error': 'Message is required'
             }), 400
         
+        if chat_stream_requested(data, request.headers):
+            events = stream_chat_events(message, image, bypass=chat_cache_bypassed(request.headers))
+            return Response(events, mimetype='text/event-stream', headers=SSE_HEADERS)
+        
         if image:
-            response_text = f"I can see you've attached an image. For free image analysis, I recommend using these services:\n\n"
-            response_text += "1. Upload to imgur.com and use their description\n"
-            response_text += "2. Use Google Lens (lens.google.com)\n"
-            response_text += "3. Try Hugging Face's BLIP model for image captioning\n\n"
-            response_text += f"Your question was: {message}\n\n"
-            response_text += "Note: Full vision AI requires API keys. This is a demo mode."
+            response_text = image_chat_response(message)
         else:
-            try:
-                hf_response = requests.post(
-                    HF_API_URL + "mistralai/Mistral-7B-Instruct-v0.2",
-                    json={"inputs": message, "parameters": {"max_new_tokens": 200}},
-                    timeout=10
-                )
-                
-                if hf_response.status_code == 200:
-                    result = hf_response.json()
-                    if isinstance(result, list) and len(result) > 0:
-                        response_text = result[0].get('generated_text', message)
-                        if message in response_text:
-                            response_text = response_text.replace(message, '').strip()
-                    else:
-                        response_text = "I'm an AI assistant. How can I help you today?"
-                else:
-                    response_text = generate_simple_response(message)
-            except:
-                response_text = generate_simple_response(message)
+            response_text = chat_cache.get_or_fetch(
+                hf_chat_cache_key(message), partial(fetch_hf_chat_reply, message),
+                bypass=chat_cache_bypassed(request.headers)
+            )
         
         return jsonify({
             'success': True,
             'response': response_text
         })
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print(f"Error in chat: {str(e)}")  
         return jsonify({
@@ -74,20 +438,39 @@ def chat():
         }), 500
 
 def generate_simple_response(message):
-    message_lower = message.lower()
-    
-    if any(word in message_lower for word in ['hello', 'hi', 'hey']):
-        return "Hello! I'm your AI assistant. How can I help you today?"
-    elif any(word in message_lower for word in ['how are you', 'how do you do']):
-        return "I'm doing well, thank you for asking! I'm here to help you with any questions you have."
-    elif any(word in message_lower for word in ['help', 'support']):
-        return "I'm here to help! You can ask me questions, and I'll do my best to assist you. What would you like to know?"
-    elif any(word in message_lower for word in ['bye', 'goodbye', 'see you']):
-        return "Goodbye! Feel free to come back if you have more questions."
-    elif '?' in message:
-        return f"That's an interesting question about '{message}'. Let me help you with that. For the most accurate answers, please try using a specific AI model API."
-    else:
-        return f"I understand you're asking about: {message}. I'm currently running in demo mode with limited capabilities. For full AI features, please configure an API key."
+    return intent_matchers['simple'].respond(message)
+
+def image_path_for(prompt):
+    return requests.utils.quote(prompt)
+
+IMAGE_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+IMAGE_CACHE_CONTROL = 'public, max-age=86400'
+
+def image_mimetype(head):
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'GIF8'):
+        return 'image/gif'
+    return 'image/jpeg'
+
+def fetch_pollinations_image(prompt):
+    response = pollinations_client.get(image_path_for(prompt))
+    return response.content if response.status_code == 200 else None
+
+def image_success_payload(image_id, content, image_url, inline=False):
+    payload = {
+        'success': True,
+        'imageId': image_id,
+        'url': f"/api/images/{image_id}",
+        'imageUrl': image_url,
+        'message': 'Image generated successfully using Pollinations.ai'
+    }
+    if inline:
+        image_base64 = base64.b64encode(content).decode('utf-8')
+        payload['image'] = f"data:{image_mimetype(content[:12])};base64,{image_base64}"
+    return payload
 
 @app.route('/api/generate-image', methods=['POST'])
 def generate_image():
@@ -102,25 +485,21 @@ def generate_image():
             }), 400
         
      
-        image_url = f"https://image.pollinations.ai/prompt/{requests.utils.quote(prompt)}"
-        
-        response = requests.get(image_url, timeout=30)
+        image_url = pollinations_client.url(image_path_for(prompt))
+        image_id = prompt_key(prompt)
+        content = image_cache.get_or_fetch(image_id, partial(fetch_pollinations_image, prompt))
         
-        if response.status_code == 200:
-            image_base64 = base64.b64encode(response.content).decode('utf-8')
-            
-            return jsonify({
-                'success': True,
-                'image': f"data:image/jpeg;base64,{image_base64}",
-                'imageUrl': image_url,
-                'message': 'Image generated successfully using Pollinations.ai'
-            })
+        if content is not None:
+            inline = data.get('format') == 'base64'
+            return jsonify(image_success_payload(image_id, content, image_url, inline))
         else:
             return jsonify({
                 'success': False,
                 'error': 'Failed to generate image'
             }), 500
             
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print(f"Error in generate_image: {str(e)}")
         return jsonify({
@@ -128,6 +507,152 @@ def generate_image():
             'error': str(e)
         }), 500
 
+@app.route('/api/images/<image_id>', methods=['GET'])
+def get_image(image_id):
+    try:
+        cached = image_cache.locate(image_id) if IMAGE_ID_PATTERN.match(image_id) else None
+        if cached is None:
+            return jsonify({
+                'success': False,
+                'error': 'Image not found'
+            }), 404
+        
+        if isinstance(cached, bytes):
+            response = app.response_class(cached, mimetype=image_mimetype(cached[:12]))
+            response.set_etag(image_id)
+            response.make_conditional(request)
+        else:
+            with open(cached, 'rb') as f:
+                head = f.read(12)
+            response = send_file(cached, mimetype=image_mimetype(head), etag=image_id, conditional=True)
+        response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+        return response
+    except Exception as e:
+        print(f"Error in get_image: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def run_image_job(job):
+    return image_cache.get_or_fetch(job.id, partial(fetch_pollinations_image, job.prompt)) is not None
+
+image_jobs = ImageJobQueue(run_image_job)
+IMAGE_JOB_HEARTBEAT = 15
+
+def image_job_payload(image_id, job=None):
+    # A job id is the image id. Jobs are tracked by the process that took
+    # them; any process can report a finished image from the shared cache.
+    if job is not None:
+        payload = image_jobs.status(job)
+    else:
+        payload = {'jobId': image_id, 'status': DONE, 'position': 0}
+    payload['success'] = True
+    payload['statusUrl'] = f"/api/images/jobs/{image_id}"
+    payload['eventsUrl'] = f"/api/images/jobs/{image_id}/events"
+    if payload['status'] == DONE:
+        payload['imageId'] = image_id
+        payload['url'] = f"/api/images/{image_id}"
+        if job is not None:
+            payload['imageUrl'] = pollinations_client.url(image_path_for(job.prompt))
+    return payload
+
+def find_image_job(job_id):
+    # Returns (job, payload); both None when the id is unknown.
+    if not IMAGE_ID_PATTERN.match(job_id):
+        return None, None
+    job = image_jobs.get(job_id)
+    if job is not None:
+        return job, image_job_payload(job_id, job)
+    if image_cache.locate(job_id) is not None:
+        return None, image_job_payload(job_id)
+    return None, None
+
+def image_job_not_found():
+    return jsonify({
+        'success': False,
+        'error': 'Job not found'
+    }), 404
+
+@app.route('/api/images/jobs', methods=['POST'])
+def create_image_job():
+    # Queues a generation and returns at once (202). Poll statusUrl or
+    # subscribe to eventsUrl (SSE) for completion.
+    data = request.get_json(silent=True) or {}
+    prompt = data.get('prompt', '')
+    priority = data.get('priority', 0)
+    if not isinstance(prompt, str) or not prompt.strip():
+        return jsonify({
+            'success': False,
+            'error': 'Prompt is required'
+        }), 400
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        return jsonify({
+            'success': False,
+            'error': "'priority' must be an integer"
+        }), 400
+    
+    image_id = prompt_key(prompt)
+    existing = image_jobs.get(image_id)
+    if (existing is None or existing.status in FINISHED) and image_cache.locate(image_id) is not None:
+        return jsonify(image_job_payload(image_id, existing if existing is not None and existing.status == DONE else None))
+    try:
+        job, deduplicated = image_jobs.submit(image_id, prompt, priority)
+    except QueueFull as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    payload = image_job_payload(image_id, job)
+    payload['deduplicated'] = deduplicated
+    return jsonify(payload), 202
+
+@app.route('/api/images/jobs/<job_id>', methods=['GET'])
+def get_image_job(job_id):
+    job, payload = find_image_job(job_id)
+    if payload is None:
+        return image_job_not_found()
+    return jsonify(payload)
+
+@app.route('/api/images/jobs/<job_id>', methods=['DELETE'])
+def cancel_image_job(job_id):
+    job, payload = find_image_job(job_id)
+    if payload is None:
+        return image_job_not_found()
+    if job is None or job.status != QUEUED:
+        return jsonify({
+            'success': False,
+            'error': f"Job is already {payload['status']}"
+        }), 409
+    image_jobs.cancel(job_id)
+    return jsonify(image_job_payload(job_id, job))
+
+@app.route('/api/images/jobs/<job_id>/events', methods=['GET'])
+def image_job_events(job_id):
+    # `event: status` whenever the job or its queue position changes, then a
+    # final `event: done` once it has finished, failed or been cancelled.
+    job, payload = find_image_job(job_id)
+    if payload is None:
+        return image_job_not_found()
+    
+    def generate():
+        if job is not None:
+            seen = image_jobs.status(job)
+            yield sse_event(image_job_payload(job_id, job), 'status')
+            while job.status not in FINISHED:
+                current = image_jobs.wait(job, seen, IMAGE_JOB_HEARTBEAT)
+                if current == seen:
+                    yield ': keepalive\n\n'
+                    continue
+                seen = current
+                if job.status not in FINISHED:
+                    yield sse_event(image_job_payload(job_id, job), 'status')
+        yield sse_event(image_job_payload(job_id, job) if job is not None else payload, 'done')
+    
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
 @app.route('/api/list-models', methods=['GET'])
 def list_models():
     try:
@@ -174,17 +699,13 @@ def create_reminder():
                 'error': parsed_data.get('error', 'Could not parse reminder. Try format: "Remind me to [task] on [date] at [time]"')
             }), 400
         
-        reminder = {
-            'id': len(reminders) + 1,
+        reminder = reminder_store.add({
             'task': parsed_data['task'],
             'datetime': parsed_data['datetime'],
             'email': user_email,
-            'created_at': datetime.now().isoformat(),
-            'sent': False
-        }
-        
-        with reminders_lock:
-            reminders.append(reminder)
+            'created_at': datetime.now().isoformat()
+        })
+        schedule_new_reminders([reminder])
         
         return jsonify({
             'success': True,
@@ -192,6 +713,8 @@ def create_reminder():
             'message': f'Reminder set for {parsed_data["datetime"]}'
         })
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print(f"Error creating reminder: {str(e)}")
         return jsonify({
@@ -199,108 +722,469 @@ def create_reminder():
             'error': str(e)
         }), 500
 
-def parse_reminder_simple(user_input):
+BULK_CHUNK_SIZE = 500
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 10000))
+BULK_PARSE_WORKERS = int(os.environ.get('BULK_PARSE_WORKERS', 0))
+BULK_PARSE_FAILED = 'Could not parse reminder. Try format: "Remind me to [task] on [date] at [time]"'
+
+bulk_parse_pool = None
+bulk_parse_pool_lock = threading.Lock()
+
+def parse_reminder_item(message, now):
+    # One bad message must fail only its own item, not the chunk it was
+    # parsed with, so errors come back as an unparsed result. Module-level
+    # so the process pool can pickle it.
     try:
-        task_match = re.search(r'(?:remind me to|remind|to)\s+(.+?)(?:\s+on|\s+at|\s+tomorrow|\s+next)', user_input, re.IGNORECASE)
-        
-        if not task_match:
-            task_match = re.search(r'(?:remind me to|to)\s+(.+)', user_input, re.IGNORECASE)
-        
-        if not task_match:
-            return {"parsed": False, "error": "Could not extract task"}
-        
-        task = task_match.group(1).strip()
-        
-        user_input_lower = user_input.lower()
-        now = datetime.now()
-        
-        if 'tomorrow' in user_input_lower:
-            target_date = now + timedelta(days=1)
-        elif 'next week' in user_input_lower:
-            target_date = now + timedelta(days=7)
-        elif 'next' in user_input_lower:
-            target_date = now + timedelta(days=7)  
-        else:
-            date_patterns = [
-                r'(\d{1,2})/(\d{1,2})',  
-                r'(\w+)\s+(\d{1,2})',  
-                r'(\d{4})-(\d{1,2})-(\d{1,2})'  
-            ]
-            
-            target_date = now + timedelta(hours=1)  
-        
-        time_match = re.search(r'(\d{1,2}):?(\d{2})?\s*(am|pm)?', user_input_lower)
-        if time_match:
-            hour = int(time_match.group(1))
-            minute = int(time_match.group(2)) if time_match.group(2) else 0
-            am_pm = time_match.group(3)
-            
-            if am_pm == 'pm' and hour < 12:
-                hour += 12
-            elif am_pm == 'am' and hour == 12:
-                hour = 0
-            
-            target_date = target_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return parse_reminder(message, now)
+    except Exception as e:
+        return {'parsed': False, 'error': f"{BULK_PARSE_FAILED} ({str(e)})"}
+
+def parse_reminders_batch(messages, now):
+    # Parsing is pure CPU work, so it only runs in parallel when a process
+    # pool is configured with BULK_PARSE_WORKERS; otherwise it stays inline.
+    global bulk_parse_pool
+    if BULK_PARSE_WORKERS > 1 and len(messages) >= BULK_PARSE_WORKERS * 50:
+        with bulk_parse_pool_lock:
+            if bulk_parse_pool is None:
+                bulk_parse_pool = ProcessPoolExecutor(max_workers=BULK_PARSE_WORKERS)
+        chunksize = max(1, len(messages) // (BULK_PARSE_WORKERS * 4))
+        return list(bulk_parse_pool.map(partial(parse_reminder_item, now=now), messages, chunksize=chunksize))
+    return [parse_reminder_item(message, now) for message in messages]
+
+def iter_bulk_items(default_email):
+    # Yields (index, item, error). NDJSON bodies are read line by line so a
+    # large import never has to be held in memory as one JSON document.
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        index = 0
+        for line in io.BufferedReader(request.stream, buffer_size=65536):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield index, json.loads(line), None
+            except ValueError:
+                yield index, None, 'Invalid JSON line'
+            index += 1
+        return
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        default_email = data.get('email', default_email)
+        data = data.get('reminders')
+    if not isinstance(data, list):
+        yield 0, None, 'Body must be a JSON array, an object with "reminders", or NDJSON'
+        return
+    for index, item in enumerate(data):
+        yield index, item, None
+
+def create_reminders_batch(batch, default_email, now):
+    results = {}
+    pending = []
+    for index, item, error in batch:
+        if error is None and isinstance(item, str):
+            item = {'message': item}
+        if error is None and not isinstance(item, dict):
+            error = 'Each reminder must be an object or a string'
+        if error is None:
+            message = item.get('message', '')
+            email = item.get('email') or default_email
+            if not message or not email:
+                error = 'Message and email are required'
+            elif not isinstance(message, str) or not isinstance(email, str):
+                error = 'Message and email must be strings'
+        if error is not None:
+            results[index] = {'index': index, 'success': False, 'error': error}
         else:
-            target_date = target_date.replace(hour=9, minute=0, second=0, microsecond=0)
-        
-        return {
-            "parsed": True,
-            "task": task,
-            "datetime": target_date.strftime("%Y-%m-%d %H:%M")
-        }
+            pending.append((index, message, email))
+    
+    parsed = parse_reminders_batch([message for _, message, _ in pending], now)
+    new_reminders = []
+    new_indexes = []
+    for (index, _, email), parsed_data in zip(pending, parsed):
+        if not parsed_data.get('parsed', False):
+            results[index] = {'index': index, 'success': False, 'error': parsed_data.get('error', BULK_PARSE_FAILED)}
+            continue
+        new_reminders.append({
+            'task': parsed_data['task'],
+            'datetime': parsed_data['datetime'],
+            'email': email,
+            'created_at': now.isoformat()
+        })
+        new_indexes.append(index)
+    
+    if new_reminders:
+        saved = reminder_store.add_many(new_reminders)
+        schedule_new_reminders(saved)
+        for index, reminder in zip(new_indexes, saved):
+            results[index] = {'index': index, 'success': True, 'reminder': reminder}
+    return [results[index] for index, _, _ in batch]
+
+@app.route('/api/reminders/bulk', methods=['POST'])
+def create_reminders_bulk():
+    default_email = request.args.get('email', '')
+    now = datetime.now()
+    items = iter_bulk_items(default_email)
+    # Read up to the first item before the response starts, so a body that
+    # is over the cap from the outset still gets a plain 413, and an empty one
+    # isn't reported as a successful import of nothing.
+    first = next(items, None)
+    if first is None:
+        return jsonify({
+            'success': False,
+            'error': 'No reminders in the request body'
+        }), 400
+    
+    def generate():
+        created = failed = total = 0
+        batch = [first] if first is not None else []
+        error = None
+        while error is None:
+            try:
+                for entry in items:
+                    batch.append(entry)
+                    if len(batch) >= BULK_CHUNK_SIZE:
+                        break
+            except RequestEntityTooLarge:
+                # A chunked body over the cap. The response has already
+                # started, so say so in the stream; items read before the
+                # cap are still created.
+                error = f'Request body too large (limit {request.max_content_length} bytes)'
+            if not batch:
+                break
+            if total + len(batch) > BULK_MAX_ITEMS:
+                error = f'At most {BULK_MAX_ITEMS} reminders per request'
+                break
+            total += len(batch)
+            try:
+                results = create_reminders_batch(batch, default_email, now)
+            except Exception as e:
+                print(f"Error creating reminders in bulk: {str(e)}")
+                results = [{'index': index, 'success': False, 'error': str(e)} for index, _, _ in batch]
+            for result in results:
+                if result['success']:
+                    created += 1
+                else:
+                    failed += 1
+                yield json.dumps(result) + '\n'
+            batch = []
+        if error is not None:
+            yield json.dumps({'success': False, 'error': error}) + '\n'
+        yield json.dumps({'summary': {'total': total, 'created': created, 'failed': failed}}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def parse_reminder_simple(user_input):
+    try:
+        return parse_reminder(user_input)
     except Exception as e:
         return {"parsed": False, "error": str(e)}
 
+REMINDER_PAGE_SIZE = 100
+REMINDER_MAX_PAGE_SIZE = 1000
+
+def encode_reminder_cursor(position):
+    raw = json.dumps(list(position)).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_reminder_cursor(cursor):
+    due_ts, reminder_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return float(due_ts), int(reminder_id)
+
+def parse_due_filter(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
 @app.route('/api/reminders', methods=['GET'])
 def get_reminders():
     try:
-        with reminders_lock:
-            active_reminders = [r for r in reminders if not r['sent']]
-        return jsonify({
-            'success': True,
-            'reminders': active_reminders
-        })
+        args = request.args
+        try:
+            limit = min(int(args.get('limit', REMINDER_PAGE_SIZE)), REMINDER_MAX_PAGE_SIZE)
+            after = decode_reminder_cursor(args['cursor']) if args.get('cursor') else None
+            due_from = parse_due_filter(args.get('due_after'))
+            due_to = parse_due_filter(args.get('due_before'))
+        except (ValueError, TypeError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid limit, cursor or due date filter'
+            }), 400
+        if limit < 1:
+            return jsonify({
+                'success': False,
+                'error': 'limit must be positive'
+            }), 400
+        status = args.get('status', 'pending')
+        if status not in REMINDER_STATUSES:
+            return jsonify({
+                'success': False,
+                'error': f"status must be one of: {', '.join(REMINDER_STATUSES)}"
+            }), 400
+        
+        fields = [f for f in args.get('fields', '').split(',') if f]
+        unknown = [f for f in fields if f not in REMINDER_FIELDS]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown fields: {', '.join(unknown)}"
+            }), 400
+        
+        # The store version changes on every write, so it plus the query string
+        # identifies the response without running the query.
+        etag = hashlib.sha1(f"{reminder_store.version()}?{request.query_string.decode('utf-8')}".encode('utf-8')).hexdigest()
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            active_reminders, next_position = reminder_store.query(
+                email=args.get('email') or None,
+                due_from=due_from,
+                due_to=due_to,
+                after=after,
+                limit=limit,
+                status=status
+            )
+            if fields:
+                active_reminders = [{f: r[f] for f in fields} for r in active_reminders]
+            response = jsonify({
+                'success': True,
+                'reminders': active_reminders,
+                'next_cursor': encode_reminder_cursor(next_position) if next_position else None
+            })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+def mark_reminders_delivered(reminders):
+    reminder_store.mark_sent([reminder['id'] for reminder in reminders])
+    for reminder in reminders:
+        reminder['sent'] = True
+
+def mark_reminder_dead_lettered(reminder, error):
+    # Recorded in the store so that a restart or leader failover doesn't load
+    # it as pending and send it all over again.
+    reminder_store.mark_failed(reminder['id'], str(error))
+    reminder['failed'] = True
+    reminder['error'] = str(error)
+
+email_delivery = EmailDeliveryService(on_sent=mark_reminders_delivered, on_dead_letter=mark_reminder_dead_lettered)
+
 def send_email_reminder(reminder):
+    # Delivery happens on the email worker pool; the reminder is only marked
+    # sent once the backend has accepted it.
+    email_delivery.submit(reminder)
+    return True
+
+def deliver_due_reminder(reminder):
+    if not reminder['sent']:
+        send_email_reminder(reminder)
+
+reminder_scheduler = ReminderScheduler(deliver_due_reminder)
+reminder_sync = ReminderSync(reminder_store, reminder_scheduler,
+                             interval=float(os.environ.get('REMINDER_SYNC_INTERVAL', 1)))
+
+# 'local': this process runs the scheduler and schedules its own reminders.
+# 'elected': only the process holding the leader lock runs the scheduler and
+# picks up reminders from the shared store. 'off': never. Set by create_app().
+scheduler_mode = 'local'
+scheduler_leader = None
+SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE', os.environ.get('REMINDER_DB', 'reminders.db') + '.leader')
+
+def schedule_new_reminders(reminders):
+    if scheduler_mode == 'local':
+        reminder_scheduler.schedule_many((parse_due_time(r['datetime']), r) for r in reminders)
+
+def load_pending_reminders():
+    return reminder_sync.load()
+
+def start_reminder_services():
+    restored = load_pending_reminders()
+    email_delivery.start()
+    reminder_scheduler.start()
+    if scheduler_mode == 'elected':
+        reminder_sync.start()
+    print(f"🔔 Reminder scheduler started in process {os.getpid()}! ({restored} pending reminders restored)")
+
+def stop_reminder_services():
+    if scheduler_leader is not None:
+        scheduler_leader.stop(timeout=5)
+    reminder_sync.stop(timeout=5)
+    reminder_scheduler.stop(timeout=5)
+    email_delivery.stop(timeout=5)
+
+def create_app(scheduler=None):
+    # Entry points (wsgi.py, asgi.py, __main__) call this once per process.
+    global scheduler_mode, scheduler_leader
+    scheduler_mode = scheduler or os.environ.get('SCHEDULER_MODE', 'elected')
+    if scheduler_mode == 'local':
+        start_reminder_services()
+    elif scheduler_mode == 'elected':
+        if isinstance(reminder_store, MemoryReminderStore):
+            print("⚠️ REMINDER_STORE=memory is per process; with several workers only the leader's own reminders fire")
+        scheduler_leader = FileLockLeader(SCHEDULER_LOCK_FILE, start_reminder_services,
+                                          retry_interval=float(os.environ.get('SCHEDULER_LEADER_RETRY', 5)))
+        scheduler_leader.start()
+    elif scheduler_mode != 'off':
+        raise ValueError(f"Unknown SCHEDULER_MODE: {scheduler_mode}")
+    return app
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        'success': True,
+        'upstreams': {client.name: client.metrics.snapshot() for client in upstream_clients},
+        'image_cache': image_cache.snapshot(),
+        'chat_cache': chat_cache.snapshot(),
+        'email_delivery': email_delivery.snapshot(),
+        'finetune_analysis_cache': analysis_cache.snapshot(),
+        'circuit_breakers': {'huggingface': hf_breakers.snapshot()},
+        'image_jobs': image_jobs.snapshot(),
+        'rate_limiter': rate_limiter.snapshot()
+    })
+
+def counter_values(snapshot, names):
+    return {name: snapshot[name] for name in names}
+
+metrics_registry.gauge('zbot_http_requests_in_flight', 'Requests currently being served',
+                       lambda: request_metrics.in_flight)
+metrics_registry.gauge('zbot_reminders_pending', 'Reminders waiting in the scheduler heap',
+                       reminder_scheduler.pending)
+metrics_registry.gauge('zbot_scheduler_lag_seconds', 'How late the most recently fired reminder was',
+                       lambda: reminder_scheduler.last_lag)
+metrics_registry.gauge('zbot_scheduler_overdue_seconds', 'How long the earliest pending reminder is past due',
+                       lambda: max(0.0, time.time() - (reminder_scheduler.next_due() or time.time())))
+metrics_registry.gauge('zbot_scheduler_up', 'Whether the reminder scheduler thread is running',
+                       lambda: 1 if reminder_scheduler.status() == 'running' else 0)
+metrics_registry.gauge('zbot_scheduler_fired_total', 'Reminders fired by the scheduler',
+                       lambda: reminder_scheduler.fired, kind='counter')
+metrics_registry.gauge('zbot_image_jobs', 'Image jobs by state', lambda: {
+    state: image_jobs.snapshot()[state] for state in ('queued', 'running')
+}, labels=('state',))
+metrics_registry.gauge('zbot_image_job_events_total', 'Image job events',
+                       lambda: counter_values(image_jobs.snapshot(), tuple(image_jobs.counters)),
+                       labels=('event',), kind='counter')
+metrics_registry.gauge('zbot_rate_limit_decisions_total', 'Requests checked against rate limits, by outcome',
+                       lambda: dict(rate_limiter.counters), labels=('outcome',), kind='counter')
+metrics_registry.gauge('zbot_email_queue_depth', 'Reminder emails queued or waiting for a retry',
+                       email_delivery.queue_depth)
+metrics_registry.gauge('zbot_email_events_total', 'Reminder email delivery events',
+                       lambda: counter_values(email_delivery.snapshot(),
+                                              ('sent', 'failed_attempts', 'retried', 'dead_lettered', 'batches')),
+                       labels=('event',), kind='counter')
+for field in ('requests', 'errors', 'retries'):
+    metrics_registry.gauge(f'zbot_upstream_{field}_total', f'Upstream {field} per upstream',
+                           lambda field=field: {client.name: getattr(client.metrics, field) for client in upstream_clients},
+                           labels=('upstream',), kind='counter')
+metrics_registry.gauge('zbot_circuit_state', 'Upstream circuit state per model (0 closed, 1 half-open, 2 open)',
+                       lambda: {('huggingface', model): breaker.STATE_VALUES[breaker.state]
+                                for model, breaker in hf_breakers.items()},
+                       labels=('upstream', 'model'))
+metrics_registry.gauge(
+    'zbot_circuit_events_total', 'Circuit breaker events per model',
+    lambda: {('huggingface', model, name): value
+             for model, breaker in hf_breakers.items() for name, value in breaker.counters.items()},
+    labels=('upstream', 'model', 'event'), kind='counter'
+)
+metrics_registry.gauge(
+    'zbot_cache_events_total', 'Cache lookups by cache and outcome',
+    lambda: {
+        **{('chat', name): value for name, value in chat_cache.snapshot().items() if name in chat_cache.counters},
+        **{('image', name): value for name, value in image_cache.snapshot().items() if name in image_cache.counters},
+        **{('finetune_analysis', name): value for name, value in analysis_cache.counters.items()}
+    },
+    labels=('cache', 'event'), kind='counter'
+)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILER_MAX_SECONDS = 60
+profiler = SamplingProfiler()
+
+@app.route('/debug/profile', methods=['GET'])
+def profile():
+    # Samples every thread's stack for ?seconds= (default 5) and returns the
+    # hottest stacks, or the folded format for flamegraph.pl/speedscope with
+    # ?format=folded. Disabled unless PROFILER_ENABLED is set.
+    if not PROFILER_ENABLED:
+        return jsonify({'success': False, 'error': 'Profiler is disabled; set PROFILER_ENABLED=1'}), 404
+    seconds = min(request.args.get('seconds', 5, type=float), PROFILER_MAX_SECONDS)
     try:
-       
-        print(f"📧 Sending reminder email to {reminder['email']}")
-        print(f"Task: {reminder['task']}")
-        print(f"Time: {reminder['datetime']}")
-        
-        reminder['sent'] = True
-        
-        
-        
-        return True
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        return False
+        samples, stacks = profiler.sample(seconds, include_idle=request_flag('include_idle', False))
+    except RuntimeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    if request.args.get('format') == 'folded':
+        body = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+        return Response(body, mimetype='text/plain')
+    return jsonify({
+        'success': True,
+        'seconds': seconds,
+        'samples': samples,
+        'stacks': [
+            {'count': count, 'share': round(count / samples, 4) if samples else 0, 'stack': stack.split(';')}
+            for stack, count in stacks.most_common(request.args.get('limit', 20, type=int))
+        ]
+    })
 
-def check_reminders():
-    while True:
-        try:
-            current_time = datetime.now()
-            with reminders_lock:
-                for reminder in reminders:
-                    if not reminder['sent']:
-                        reminder_time = datetime.strptime(reminder['datetime'], "%Y-%m-%d %H:%M")
-                        if current_time >= reminder_time:
-                            send_email_reminder(reminder)
-            time.sleep(30) 
-        except Exception as e:
-            print(f"Error in reminder checker: {str(e)}")
-            time.sleep(30)
+SCHEDULER_MAX_OVERDUE = float(os.environ.get('SCHEDULER_MAX_OVERDUE', 60))
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy'})
+    # Readiness: 503 when the store is unreachable, the scheduler thread has
+    # died, reminders are stuck past due, or every email worker has exited.
+    checks = {}
+    ready = True
+    try:
+        reminder_store.version()
+        checks['store'] = {'status': 'ok'}
+    except Exception as e:
+        checks['store'] = {'status': 'error', 'error': str(e)}
+        ready = False
+    
+    scheduler_status = reminder_scheduler.status()
+    next_due = reminder_scheduler.next_due()
+    overdue = max(0.0, time.time() - next_due) if next_due is not None else 0.0
+    if scheduler_status == 'running' and overdue > SCHEDULER_MAX_OVERDUE:
+        scheduler_status = 'lagging'
+    if scheduler_mode == 'elected' and not scheduler_leader.is_leader:
+        scheduler_status = 'standby'
+    checks['scheduler'] = {
+        'status': scheduler_status,
+        'mode': scheduler_mode,
+        'pid': os.getpid(),
+        'pending': reminder_scheduler.pending(),
+        'overdue_seconds': round(overdue, 3),
+        'last_lag_seconds': round(reminder_scheduler.last_lag, 3)
+    }
+    if scheduler_status in ('dead', 'lagging'):
+        ready = False
+    
+    alive_workers = email_delivery.alive_workers()
+    checks['email_delivery'] = {
+        'workers': alive_workers,
+        'queue_depth': email_delivery.queue_depth()
+    }
+    # Email workers only run where the scheduler does, so followers on
+    # standby (and processes with the scheduler off) have none by design.
+    email_expected = scheduler_mode != 'off' and scheduler_status not in ('stopped', 'standby')
+    if email_delivery.workers and email_expected and alive_workers == 0:
+        ready = False
+    
+    # An open circuit doesn't fail readiness (chat still answers from the
+    # fallback) but reports the service as degraded.
+    circuits = hf_breakers.snapshot()
+    checks['upstream_circuits'] = {
+        f"huggingface/{model}": {'state': c['state'], 'retry_in_seconds': c['retry_in_seconds']}
+        for model, c in circuits.items()
+    }
+    degraded = any(c['state'] != 'closed' for c in circuits.values())
+    
+    status = 'unhealthy' if not ready else 'degraded' if degraded else 'healthy'
+    return jsonify({'status': status, 'checks': checks}), 200 if ready else 503
 
 @app.route('/api/finetune/example-data', methods=['GET'])
 def get_example_data():
@@ -357,51 +1241,208 @@ def get_example_data():
 
 @app.route('/api/finetune/prepare', methods=['POST'])
 def prepare_finetune():
+    # Accepts the {"training_data": [...]} JSON body, a bare JSON array, a
+    # JSONL body, or a multipart upload in a 'file' field. Arrays and JSONL
+    # are validated as they stream in.
     try:
-        data = request.json
-        training_data = data.get('training_data', [])
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({
+                    'success': False,
+                    'error': "Upload the dataset in a 'file' field"
+                }), 400
+            examples = iter_uploaded_examples(upload.stream)
+        elif request.mimetype == 'application/json':
+            examples = iter_uploaded_examples(request.stream, wrapper_key='training_data')
+        else:
+            examples = iter_uploaded_examples(request.stream)
+        
+        validator = DatasetValidator()
+        for index, example, error in examples:
+            if not validator.add(index, example, error):
+                break
         
-        if not training_data:
+        if validator.total == 0:
             return jsonify({
                 'success': False,
                 'error': 'Training data is required'
             }), 400
         
-        errors = []
-        for idx, example in enumerate(training_data):
-            if 'messages' not in example:
-                errors.append(f"Example {idx}: Missing 'messages' field")
-            elif not isinstance(example['messages'], list):
-                errors.append(f"Example {idx}: 'messages' must be a list")
-            elif len(example['messages']) < 2:
-                errors.append(f"Example {idx}: Need at least 2 messages (user + assistant)")
-        
-        if errors:
+        if validator.errors:
             return jsonify({
                 'success': False,
-                'validation_errors': errors
+                'validation_errors': validator.errors,
+                'error_limit_reached': validator.error_limit_reached,
+                **validator.summary()
             }), 400
         
-        jsonl_content = '\n'.join([json.dumps(example) for example in training_data])
-        
         return jsonify({
             'success': True,
             'message': 'Training data validated successfully',
-            'total_examples': len(training_data),
-            'jsonl_preview': jsonl_content[:500] + '...' if len(jsonl_content) > 500 else jsonl_content,
+            **validator.summary(),
+            'jsonl_preview': validator.preview(),
             'info': 'Data is ready for fine-tuning. In production, upload this to OpenAI and start a fine-tuning job.'
         })
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/finetune/analyze', methods=['POST'])
+def analyze_finetune():
+    # Takes the same body formats as /api/finetune/prepare. The raw upload is
+    # hashed while it is spooled, so re-submitting a dataset is a cache hit.
+    try:
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({
+                    'success': False,
+                    'error': "Upload the dataset in a 'file' field"
+                }), 400
+            source = upload.stream
+        else:
+            source = request.stream
+        epochs = request.args.get('epochs')
+        if epochs is not None:
+            if not epochs.isdecimal() or not 1 <= int(epochs) <= 50:
+                return jsonify({
+                    'success': False,
+                    'error': 'epochs must be an integer between 1 and 50'
+                }), 400
+            epochs = int(epochs)
+        
+        dataset_hash, spool = spool_stream(source)
+        wrapper_key = 'training_data' if request.mimetype == 'application/json' else None
+        
+        def compute():
+            start = time.perf_counter()
+            analysis = analyse_examples(iter_uploaded_examples(spool, wrapper_key=wrapper_key))
+            result = analysis.result(epochs=epochs)
+            result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            return result
+        
+        with closing(spool):
+            result, cached = analysis_cache.get_or_compute((dataset_hash, wrapper_key, epochs), compute)
+        
+        if result['total_examples'] == 0:
+            return jsonify({
+                'success': False,
+                'error': 'Training data is required'
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'dataset_hash': dataset_hash,
+            'cached': cached,
+            **result
+        })
+        
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+FINETUNE_TEST_MAX_PROMPTS = int(os.environ.get('FINETUNE_TEST_MAX_PROMPTS', 1000))
+
+def rule_based_reply(matcher_name):
+    def reply(message):
+        response, intent = intent_matchers[matcher_name].respond_with_intent(message)
+        return response, intent is None
+    return reply
+
+def hf_eval_reply(message):
+    # Goes straight to the upstream (not the chat cache) so latencies reflect the model.
+    response, ok = fetch_hf_chat_reply(message)
+    return response, not ok
+
+def finetune_eval_models(include_hf):
+    models = [
+        EvalModel('base_model', 'Rule-based (base - generic)', rule_based_reply('simple')),
+        EvalModel('finetuned_model', 'Rule-based (fine-tuned - customer support)', rule_based_reply('customer_support'))
+    ]
+    if include_hf:
+        models.append(EvalModel('hf_model', HF_CHAT_MODEL, hf_eval_reply, remote=True))
+    return models
+
+def iter_eval_prompt_items(upload):
+    # Plain-text uploads are one prompt per line; anything else is JSONL or a
+    # JSON array of prompts.
+    if upload.mimetype == 'text/plain' or (upload.filename or '').endswith('.txt'):
+        for line in io.TextIOWrapper(upload.stream, encoding='utf-8'):
+            if line.strip():
+                yield line.strip(), None
+        return
+    for _, item, error in iter_uploaded_examples(upload.stream):
+        yield item, error
+
+def request_flag(name, default):
+    value = request.values.get(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes')
+
+def run_finetune_batch_test(items, include_hf, include_responses):
+    prompts = []
+    errors = []
+    for index, (item, error) in enumerate(items):
+        if index >= FINETUNE_TEST_MAX_PROMPTS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {FINETUNE_TEST_MAX_PROMPTS} prompts per batch'
+            }), 400
+        prompt, error = (None, error) if error else parse_eval_prompt(item)
+        if error:
+            errors.append(f"Prompt {index}: {error}")
+        else:
+            prompts.append(prompt)
+    if errors or not prompts:
+        return jsonify({
+            'success': False,
+            'error': 'At least one prompt is required' if not errors else 'Invalid prompts',
+            'validation_errors': errors
+        }), 400
+    
+    start = time.perf_counter()
+    results, summary = run_comparison(prompts, finetune_eval_models(include_hf))
+    payload = {
+        'success': True,
+        'total_prompts': len(prompts),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        'models': summary
+    }
+    if include_responses:
+        payload['results'] = results
+    return jsonify(payload)
+
 @app.route('/api/finetune/test', methods=['POST'])
 def test_finetuned_model():
+    # Single-message mode takes {"message": ...}. Batch mode takes
+    # {"prompts": [...]} or a multipart 'file' upload and returns aggregate
+    # metrics per model; include_hf adds the Hugging Face model to the comparison.
     try:
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({
+                    'success': False,
+                    'error': "Upload the prompts in a 'file' field"
+                }), 400
+            return run_finetune_batch_test(iter_eval_prompt_items(upload), request_flag('include_hf', False),
+                                           request_flag('include_responses', True))
+        
         data = request.json
+        prompts = data.get('prompts', data.get('messages'))
+        if isinstance(prompts, list):
+            return run_finetune_batch_test(((item, None) for item in prompts), bool(data.get('include_hf', False)),
+                                           bool(data.get('include_responses', True)))
+        
         user_message = data.get('message', '')
         
         if not user_message:
@@ -427,6 +1468,8 @@ def test_finetuned_model():
             'info': 'This demonstrates how fine-tuning customizes responses. The "fine-tuned" version provides specific customer support responses vs generic answers.'
         })
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print(f"Error testing models: {str(e)}")
         return jsonify({
@@ -435,115 +1478,12 @@ def test_finetuned_model():
         }), 500
 
 def generate_customer_support_response(message):
-    message_lower = message.lower()
-    
-    if 'password' in message_lower or 'reset' in message_lower:
-        return """To reset your password, please follow these steps:
-1) Go to the login page at www.techcorp.com/login
-2) Click on 'Forgot Password' below the login button
-3) Enter your registered email address
-4) Check your email for a password reset link
-5) Click the link and create a new password
-
-The link will expire in 24 hours for security. If you don't receive the email, please check your spam folder.
-
-Is there anything else I can help you with?"""
-    
-    elif 'business hours' in message_lower or 'hours' in message_lower or 'open' in message_lower:
-        return """TechCorp customer support is available:
-- Monday to Friday: 9:00 AM - 6:00 PM EST
-- Saturday: 10:00 AM - 4:00 PM EST
-- Sunday: Closed
-
-For critical issues, we offer 24/7 emergency support. You can reach us at:
-- Phone: 1-800-TECHCORP
-- Email: support@techcorp.com
-- Live Chat: Available during business hours
-
-How else can I assist you today?"""
-    
-    elif 'refund' in message_lower:
-        return """I'd be happy to help you with a refund. Here's our process:
-1) Log into your TechCorp account
-2) Navigate to 'My Orders' in your account dashboard
-3) Find the order you wish to return
-4) Click 'Request Refund' and select a reason
-5) Fill out the refund request form
-
-Our refund policy:
-- Full refunds within 30 days of purchase
-- Item must be in original condition
-- Refunds processed within 5-7 business days
-
-Would you like help with any specific order?"""
-    
-    elif 'discount' in message_lower or 'student' in message_lower:
-        return """Great news! TechCorp offers several discount programs:
-
-Student Discount: 20% off all products
-- Verify with your .edu email address
-- Valid student ID required
-- Discount applies automatically at checkout
-
-Other available discounts:
-- Military/Veterans: 15% off
-- Teachers/Educators: 15% off
-- Referral Program: $20 credit for each referral
-
-To activate your discount, please create or log into your account.
-
-Can I help you with anything else?"""
-    
-    elif 'not working' in message_lower or 'broken' in message_lower or 'issue' in message_lower:
-        return """I'm sorry you're experiencing issues with your product. Let's troubleshoot together:
-
-Step 1: Basic checks
-- Is the device powered on?
-- Are all cables securely connected?
-- Have you tried restarting the device?
-
-Step 2: If issue persists
-- Check for software updates
-- Review the troubleshooting guide in your product manual
-- Try resetting to factory settings (back up data first!)
-
-Step 3: Still need help?
-Contact our technical support team:
-- Phone: 1-800-TECH-HELP
-- Chat: Available on our website
-- Schedule a video call with a technician
-
-What specific issue are you experiencing? I'm here to help!"""
-    
-    else:
-        return f"""Thank you for contacting TechCorp support!
-
-I understand you're asking about: "{message}"
-
-I'm here to help you with:
-- Account and password issues
-- Product troubleshooting
-- Orders and refunds
-- Business hours and contact information
-- Discounts and promotions
-
-Could you please provide more details about your question so I can assist you better?
-
-You can also:
-- Call us at 1-800-TECHCORP
-- Email support@techcorp.com
-- Visit our Help Center at www.techcorp.com/help
-
-Is there anything specific I can help you with today?"""
-        print(f"Error testing models: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return intent_matchers['customer_support'].respond(message)
 
 if __name__ == '__main__':
-    reminder_thread = threading.Thread(target=check_reminders, daemon=True)
-    reminder_thread.start()
-    print("🔔 Reminder checker started!")
+    # With the reloader on, this file runs once in a watcher process and
+    # again in the serving child (WERKZEUG_RUN_MAIN); only the child runs the
+    # scheduler, so reminders aren't sent twice.
+    create_app('local' if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' else 'off')
     
     app.run(debug=True, port=5000)
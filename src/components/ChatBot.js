@@ -2,7 +2,52 @@ import React, { useState, useRef, useEffect } from 'react';
 import axios from 'axios';
 import './ChatBot.css';
 
-function ChatBot() {
+const CHAT_URL = 'http://localhost:5000/api/chat';
+
+// Reads a Server-Sent Events response from /api/chat, calling onToken for each
+// streamed chunk and resolving with the final response text.
+async function streamChat(payload, onToken) {
+  const response = await fetch(CHAT_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify({ ...payload, stream: true })
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Chat request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let finalText = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let eventName = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const parsed = JSON.parse(data);
+      if (eventName === 'done') {
+        finalText = parsed.response;
+      } else if (parsed.token) {
+        finalText += parsed.token;
+        onToken(parsed.token);
+      }
+    }
+  }
+  return finalText;
+}
+
+function ChatBot({ stream = false }) {
   const [messages, setMessages] = useState([
     { role: 'bot', content: 'Hello! I\'m your AI assistant. How can I help you today? You can also attach images and ask me about them!' }
   ]);
@@ -39,8 +84,16 @@ function ChatBot() {
     }]);
     setLoading(true);
 
+    if (stream) {
+      await handleStreamingSend({
+        message: userMessage || 'What is in this image?',
+        image: selectedImage
+      });
+      return;
+    }
+
     try {
-      const response = await axios.post('http://localhost:5000/api/chat', {
+      const response = await axios.post(CHAT_URL, {
         message: userMessage || 'What is in this image?',
         image: selectedImage // Send base64 image
       });
@@ -66,6 +119,40 @@ function ChatBot() {
     }
   };
 
+  const handleStreamingSend = async (payload) => {
+    let started = false;
+    const appendToken = (token) => {
+      if (!started) {
+        started = true;
+        setLoading(false);
+        setMessages(prev => [...prev, { role: 'bot', content: token }]);
+        return;
+      }
+      setMessages(prev => {
+        const last = prev[prev.length - 1];
+        return [...prev.slice(0, -1), { ...last, content: last.content + token }];
+      });
+    };
+
+    try {
+      const finalText = await streamChat(payload, appendToken);
+      setMessages(prev => {
+        if (!started) {
+          return [...prev, { role: 'bot', content: finalText }];
+        }
+        const last = prev[prev.length - 1];
+        return [...prev.slice(0, -1), { ...last, content: finalText }];
+      });
+    } catch (error) {
+      setMessages(prev => [...prev, {
+        role: 'bot',
+        content: 'Sorry, I couldn\'t connect to the server. Please make sure the server is running.'
+      }]);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleImageSelect = (e) => {
     const file = e.target.files[0];
     if (file && file.type.startsWith('image/')) {
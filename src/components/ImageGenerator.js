@@ -20,7 +20,7 @@ function ImageGenerator() {
 
       if (response.data.success) {
         setResult({
-          image: response.data.image,
+          image: `http://localhost:5000${response.data.url}`,
           imageUrl: response.data.imageUrl,
           message: response.data.message
         });
@@ -15,10 +15,18 @@ function ReminderAgent() {
 
   const fetchReminders = async () => {
     try {
-      const response = await axios.get('http://localhost:5000/api/reminders');
-      if (response.data.success) {
-        setReminders(response.data.reminders);
-      }
+      // The endpoint is paginated, so follow next_cursor until the last page.
+      const all = [];
+      let cursor = null;
+      do {
+        const response = await axios.get('http://localhost:5000/api/reminders', {
+          params: cursor ? { cursor } : {}
+        });
+        if (!response.data.success) return;
+        all.push(...response.data.reminders);
+        cursor = response.data.next_cursor;
+      } while (cursor);
+      setReminders(all);
     } catch (error) {
       console.error('Error fetching reminders:', error);
     }
@@ -0,0 +1,267 @@
+import math
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StackCounter
+
+# Request latencies in seconds, Prometheus' default buckets plus a 30s tail
+# for slow image generations.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, format_labels(self.labels, key), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines += [f'{name}{labels} {format_value(value)}' for name, labels, value in self.samples()]
+        return lines
+
+
+class Gauge:
+    # Read at scrape time: fn() returns a number, or a {label_values: number}
+    # dict when the gauge has labels. Also used for counters whose value is
+    # owned elsewhere (kind='counter').
+
+    def __init__(self, name, help, fn, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {str(e)}")
+            return lines
+        if not self.labels:
+            value = {(): value}
+        for key, sample in sorted(value.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f'{self.name}{format_labels(self.labels, key)} {format_value(sample)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labels, key, [('le', format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, fn, labels=(), kind='gauge'):
+        return self.register(Gauge(name, help, fn, labels, kind))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetricsMiddleware:
+    # WSGI middleware that times each request until its body has been fully
+    # sent, so streamed responses (SSE, NDJSON) are measured end to end.
+    # The route label comes from ROUTE_ENVIRON_KEY, which the app sets to the
+    # matched URL rule; unmatched paths share one label.
+
+    ROUTE_ENVIRON_KEY = 'zbot.route'
+
+    def __init__(self, wsgi_app, histogram):
+        self.wsgi_app = wsgi_app
+        self.histogram = histogram
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _track(self, delta):
+        with self._lock:
+            self.in_flight += delta
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        status = ['500']
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        def record():
+            self._track(-1)
+            route = environ.get(self.ROUTE_ENVIRON_KEY, 'unmatched')
+            self.histogram.observe(time.perf_counter() - start, environ.get('REQUEST_METHOD', ''), route, status[0])
+
+        self._track(1)
+        try:
+            body = self.wsgi_app(environ, recording_start_response)
+        except Exception:
+            record()
+            raise
+        return ClosingIterator(body, record)
+
+
+class ClosingIterator:
+    # Calls on_close once, when the body is exhausted or closed, whichever
+    # happens first.
+
+    def __init__(self, body, on_close):
+        self._body = body
+        self._iter = iter(body)
+        self._on_close = on_close
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._on_close()
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._finish()
+
+    def __del__(self):
+        # asgiref's WsgiToAsgi stops iterating once Content-Length bytes are
+        # sent and never calls close(); dropping the iterator still records.
+        self._finish()
+
+
+class SamplingProfiler:
+    # Wall-clock sampler: every interval it snapshots the stack of every
+    # other thread and counts identical stacks. Output is the "folded" format
+    # flamegraph tools read (frame;frame;frame count).
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+
+    def sample(self, seconds, include_idle=False):
+        # Blocks the calling thread for `seconds`; only one profile runs at a time.
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A profile is already running')
+        try:
+            stacks = StackCounter()
+            own = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            deadline = time.perf_counter() + seconds
+            samples = 0
+            while time.perf_counter() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    frames = traceback.extract_stack(frame, limit=self.max_depth)
+                    if not include_idle and frames and is_idle_frame(frames[-1]):
+                        continue
+                    stack = ';'.join([names.get(ident, str(ident))] +
+                                     [f'{f.name} ({short_path(f.filename)}:{f.lineno})' for f in frames])
+                    stacks[stack] += 1
+                samples += 1
+                time.sleep(self.interval)
+            return samples, stacks
+        finally:
+            self._lock.release()
+
+
+IDLE_FUNCTIONS = {'wait', 'select', 'poll', 'accept', 'get', 'readinto', 'recv_into', '_worker', 'serve_forever'}
+
+
+def is_idle_frame(frame):
+    # Threads parked in a lock/queue/socket wait aren't interesting hot paths.
+    return frame.name in IDLE_FUNCTIONS and ('threading' in frame.filename or 'queue' in frame.filename or
+                                             'socket' in frame.filename or 'selectors' in frame.filename or
+                                             'socketserver' in frame.filename or 'thread.py' in frame.filename)
+
+
+def short_path(filename):
+    parts = filename.replace('\\', '/').split('/')
+    return '/'.join(parts[-2:])
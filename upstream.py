@@ -0,0 +1,364 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import asyncio
+import json
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 503)
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class UpstreamMetrics:
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._observers = []
+
+    def add_observer(self, fn):
+        # fn(elapsed_ms, ok) is called for every recorded request, e.g. to
+        # feed a Prometheus histogram.
+        self._observers.append(fn)
+
+    def record(self, elapsed_ms, ok):
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._latencies.append(elapsed_ms)
+        for fn in self._observers:
+            fn(elapsed_ms, ok)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            snapshot = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'avg_ms': round(self.total_ms / self.requests, 2) if self.requests else 0.0,
+                'max_ms': round(self.max_ms, 2)
+            }
+        for name, q in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            snapshot[name] = round(latencies[min(len(latencies) - 1, int(len(latencies) * q))], 2) if latencies else 0.0
+        return snapshot
+
+
+def is_upstream_failure(status_code):
+    # Statuses that say the upstream is unhealthy (overloaded, down, model
+    # still loading), as opposed to a problem with our request.
+    return status_code == 429 or status_code >= 500
+
+
+class CircuitBreaker:
+    # closed -> open after failure_threshold consecutive failures; a call
+    # slower than slow_call_ms counts as a failure too. While open, allow()
+    # returns False so callers fall back at once instead of waiting out the
+    # timeout. After reset_timeout one probe is let through (half-open): a
+    # success closes the circuit, a failure reopens it for twice as long, up
+    # to max_reset_timeout. A probe that never reports back is replaced by
+    # another after the same interval.
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=5, slow_call_ms=5000, reset_timeout=15, max_reset_timeout=300):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_ms = slow_call_ms
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._open_for = reset_timeout
+        self._retry_at = 0.0
+        self.counters = {'opened': 0, 'short_circuited': 0, 'probes': 0, 'slow_calls': 0}
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now < self._retry_at:
+                self.counters['short_circuited'] += 1
+                return False
+            self._set_state(self.HALF_OPEN)
+            self._retry_at = now + self._open_for
+            self.counters['probes'] += 1
+            return True
+
+    def record(self, elapsed_ms, ok):
+        with self._lock:
+            slow = ok and elapsed_ms > self.slow_call_ms
+            if slow:
+                self.counters['slow_calls'] += 1
+            if self.state == self.OPEN:
+                # Calls that started before the circuit opened.
+                return
+            if ok and not slow:
+                self.failures = 0
+                if self.state == self.HALF_OPEN:
+                    self._open_for = self.reset_timeout
+                    self._set_state(self.CLOSED)
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self._open_for = min(self._open_for * 2, self.max_reset_timeout)
+                self._trip()
+            elif self.failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        self._retry_at = time.monotonic() + self._open_for
+        self.counters['opened'] += 1
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state):
+        if state != self.state:
+            print(f"⚡ Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot['state'] = self.state
+            snapshot['consecutive_failures'] = self.failures
+            snapshot['retry_in_seconds'] = round(max(0.0, self._retry_at - time.monotonic()), 3) \
+                if self.state != self.CLOSED else 0.0
+        return snapshot
+
+
+class CircuitBreakers:
+    # One breaker per key (e.g. per model) on an upstream, created on first
+    # use. Settings can be overridden like the client's, e.g.
+    # UPSTREAM_HUGGINGFACE_CIRCUIT_FAILURE_THRESHOLD or UPSTREAM_CIRCUIT_RESET_TIMEOUT.
+
+    def __init__(self, name, failure_threshold=5, slow_call_ms=5000, reset_timeout=15, max_reset_timeout=300):
+        prefix = f"UPSTREAM_{name.upper()}_CIRCUIT_"
+        self.name = name
+        self.settings = {
+            'failure_threshold': env_int(prefix + 'FAILURE_THRESHOLD',
+                                         env_int('UPSTREAM_CIRCUIT_FAILURE_THRESHOLD', failure_threshold)),
+            'slow_call_ms': env_float(prefix + 'SLOW_CALL_MS', env_float('UPSTREAM_CIRCUIT_SLOW_CALL_MS', slow_call_ms)),
+            'reset_timeout': env_float(prefix + 'RESET_TIMEOUT', env_float('UPSTREAM_CIRCUIT_RESET_TIMEOUT', reset_timeout)),
+            'max_reset_timeout': env_float(prefix + 'MAX_RESET_TIMEOUT',
+                                           env_float('UPSTREAM_CIRCUIT_MAX_RESET_TIMEOUT', max_reset_timeout))
+        }
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, key):
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(f"{self.name}/{key}", **self.settings)
+            return breaker
+
+    def items(self):
+        with self._lock:
+            return list(self._breakers.items())
+
+    def snapshot(self):
+        return {key: breaker.snapshot() for key, breaker in self.items()}
+
+
+class BaseUpstreamClient:
+    def __init__(self, name, base_url, pool_size=10, connect_timeout=3.05, read_timeout=30,
+                 max_retries=2, backoff=0.5, max_backoff=8, metrics=None):
+        # Every setting can be overridden per upstream, e.g. UPSTREAM_HUGGINGFACE_READ_TIMEOUT.
+        prefix = f"UPSTREAM_{name.upper()}_"
+        self.name = name
+        self.base_url = os.environ.get(prefix + 'URL', base_url)
+        self.pool_size = env_int(prefix + 'POOL_SIZE', env_int('UPSTREAM_POOL_SIZE', pool_size))
+        self.connect_timeout = env_float(prefix + 'CONNECT_TIMEOUT', connect_timeout)
+        self.read_timeout = env_float(prefix + 'READ_TIMEOUT', read_timeout)
+        self.max_retries = env_int(prefix + 'MAX_RETRIES', max_retries)
+        self.backoff = env_float(prefix + 'BACKOFF', backoff)
+        self.max_backoff = env_float(prefix + 'MAX_BACKOFF', max_backoff)
+        self.metrics = metrics or UpstreamMetrics()
+
+    def url(self, path):
+        return self.base_url + path
+
+    def retry_delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        # Full jitter keeps concurrent clients from retrying in lockstep.
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+
+class UpstreamClient(BaseUpstreamClient):
+    # Wraps one requests.Session per upstream so connections (and their TLS
+    # sessions) are kept alive and reused across Flask requests.
+
+    def __init__(self, name, base_url, **kwargs):
+        super().__init__(name, base_url, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+            except requests.RequestException:
+                self.metrics.record((time.perf_counter() - start) * 1000, False)
+                raise
+            ok = response.status_code < 400
+            self.metrics.record((time.perf_counter() - start) * 1000, ok)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            delay = self.retry_delay(attempt, response)
+            response.close()
+            self.metrics.record_retry()
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class UpstreamBusy(Exception):
+    pass
+
+
+class UpstreamStatusError(Exception):
+    def __init__(self, name, status_code):
+        super().__init__(f"{name} returned {status_code}")
+        self.status_code = status_code
+
+
+class AsyncUpstreamResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncUpstreamClient(BaseUpstreamClient):
+    # asyncio counterpart used by the ASGI entry point. A semaphore bounds the
+    # number of in-flight calls per upstream; callers that cannot get a slot
+    # within queue_timeout get UpstreamBusy instead of piling up.
+
+    def __init__(self, name, base_url, max_concurrency=64, queue_timeout=5, **kwargs):
+        super().__init__(name, base_url, **kwargs)
+        prefix = f"UPSTREAM_{self.name.upper()}_"
+        self.max_concurrency = env_int(prefix + 'MAX_CONCURRENCY', max_concurrency)
+        self.queue_timeout = env_float(prefix + 'QUEUE_TIMEOUT', queue_timeout)
+        self._semaphore = None
+        self._session = None
+
+    def _ensure_session(self):
+        # Created lazily so both belong to the event loop that serves requests.
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            )
+        return self._session
+
+    async def _send(self, session, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with session.request(method, self.url(path), **kwargs) as response:
+                content = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.metrics.record((time.perf_counter() - start) * 1000, False)
+            raise
+        self.metrics.record((time.perf_counter() - start) * 1000, response.status < 400)
+        return AsyncUpstreamResponse(response.status, response.headers, content)
+
+    async def _acquire(self):
+        session = self._ensure_session()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamBusy(f"{self.name} has {self.max_concurrency} requests in flight")
+        return session
+
+    async def stream_lines(self, method, path, **kwargs):
+        # Yields decoded response lines as they arrive. Not retried: a stream
+        # that fails to start raises so the caller can fall back. Cancelling
+        # the consumer closes the upstream connection.
+        session = await self._acquire()
+        try:
+            start = time.perf_counter()
+            try:
+                response = await session.request(method, self.url(path), **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.metrics.record((time.perf_counter() - start) * 1000, False)
+                raise
+            async with response:
+                self.metrics.record((time.perf_counter() - start) * 1000, response.status == 200)
+                if response.status != 200:
+                    raise UpstreamStatusError(self.name, response.status)
+                async for line in response.content:
+                    yield line.decode('utf-8').rstrip('\r\n')
+        finally:
+            self._semaphore.release()
+
+    async def request(self, method, path, **kwargs):
+        session = await self._acquire()
+        try:
+            attempt = 0
+            while True:
+                response = await self._send(session, method, path, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = self.retry_delay(attempt, response)
+                self.metrics.record_retry()
+                attempt += 1
+                await asyncio.sleep(delay)
+        finally:
+            self._semaphore.release()
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,6 @@
+# Production WSGI entry point, one app per worker process:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+from server import create_app
+
+app = create_app()